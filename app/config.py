@@ -1,13 +1,14 @@
 """
 配置文件
 """
+import os
 import platform
 from pathlib import Path
 
-# 路径配置
+# 路径配置（可用环境变量 HICORE_WORK_DIR / HICORE_DB_DIR 覆盖，压测时指向临时目录）
 BASE_DIR = Path(__file__).parent.parent
-WORK_DIR = BASE_DIR / "work"
-DB_DIR = BASE_DIR / "databases"
+WORK_DIR = Path(os.environ.get("HICORE_WORK_DIR", BASE_DIR / "work"))
+DB_DIR = Path(os.environ.get("HICORE_DB_DIR", BASE_DIR / "databases"))
 DB_PATH = DB_DIR / "database.db"
 
 # Poppler 路径
@@ -20,6 +21,34 @@ else:
 # 任务配置
 HEARTBEAT_TIMEOUT = 10  # 心跳超时秒数
 HEARTBEAT_INTERVAL = 5  # 心跳间隔秒数
+LEASE_FLUSH_INTERVAL = 3  # 租约批量写回数据库的间隔秒数（须小于 HEARTBEAT_TIMEOUT）
+
+# 页面图片缓存配置（work/*/tmp 下渲染出的 PNG）
+RENDER_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 总大小上限，超出时按 已完成项目 > 闲置项目 > 其他 的顺序淘汰最久未访问的页面；0 表示不限
+RENDER_CACHE_IDLE_SECONDS = 24 * 3600  # 项目的页面超过该秒数无访问视为闲置
+RENDER_DPI = 150  # PDF 转图片分辨率
+
+# PDF 目录监听配置
+PDF_WATCH_MODE = "auto"  # auto（有 watchfiles 时用文件事件，否则轮询）/ poll（轮询，适用于不支持文件事件的网络盘）/ off（只在启动和手动扫描时处理）
+PDF_WATCH_DEBOUNCE = 3.0  # 文件变化后静默多少秒才扫描（等待批量复制结束）
+PDF_WATCH_POLL_INTERVAL = 5.0  # 轮询间隔秒数
+SCAN_JOB_HISTORY = 20  # 内存中保留的后台扫描任务记录数
+
+# 调度配置
+TASK_SCHEDULER = "locality"  # 任务调度策略：locality（同一 PDF 连续分配）/ random（随机）
+SCHEDULE_STARVATION_SECONDS = 300  # 有可领取任务的项目超过该秒数未被分配时优先分配，避免低优先级项目饿死
+FETCH_CLAIM_ATTEMPTS = 5  # 领取任务时并发冲突的最大重试次数
+READY_QUEUE_BATCH = 200  # 内存就绪队列每次从数据库加载的任务数
+READY_QUEUE_LOW_WATERMARK = 50  # 就绪队列少于该数量时后台补充
+
+# 数据库配置
+SLOW_QUERY_THRESHOLD = 0.1  # 慢查询阈值秒数，超过时打印日志并记录执行计划
+SLOW_QUERY_LOG_SIZE = 100  # 内存中保留的慢查询条数
+
+# Excel 配置
+EXCEL_BUILD_WAIT = 30  # 下载时等待后台生成 Excel 的最长秒数
+EXCEL_BUILD_WORKERS = 2  # 后台生成 Excel 的线程数（不同项目可并行）
+EXCEL_LOCK_TIMEOUT = 30  # 等待项目写入锁的最长秒数
 
 # Token 配置
 TOKEN_SECRET = "your-secret-key-change-in-production"
@@ -1,13 +1,38 @@
 """
 数据库操作模块
 """
+import json
+import time
 import sqlite3
 import hashlib
-from contextlib import contextmanager
-from typing import Optional, Dict, Any
+import threading
+from collections import deque
 from datetime import datetime
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple, Iterator, Iterable, List, Set
+
+from app.config import DB_PATH, DB_DIR, SLOW_QUERY_THRESHOLD, SLOW_QUERY_LOG_SIZE
+from app.services import metrics
+
+# 语句耗时（按语句类型：SELECT / INSERT / UPDATE / DELETE / 其他）
+_QUERY_SECONDS = metrics.histogram(
+    "hicore_db_query_duration_seconds", "SQLite 语句执行耗时", ["statement"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+_STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+# 提交行字段（与 RowData 一致），submission_rows 按此建列
+ROW_FIELDS = (
+    "machine_id", "circuit_name", "area", "device_pos", "voltage", "phase_wire", "power",
+    "max_current", "run_current", "machine_switch", "factory_switch", "remark"
+)
 
-from app.config import DB_PATH, DB_DIR
+# 全文检索字段（submission_rows_fts 的列，也是 submission_rows_grams 的取词字段）
+SEARCH_FIELDS = ("machine_id", "circuit_name", "area", "device_pos", "remark")
+
+# 慢查询记录（环形缓冲，只保存 SQL 和执行计划，不保存参数）
+_slow_queries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_slow_lock = threading.Lock()
 
 
 def init_db():
@@ -66,7 +91,194 @@ def init_db():
             )
         """)
         
+        # 项目数据版本表（修改提交记录时递增，用于判断 Excel 是否过期）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS project_versions (
+                project_id TEXT PRIMARY KEY,
+                edit_version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        # 项目调度配置表（优先级高的项目先分配，同优先级按权重分配）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS project_schedule (
+                project_id TEXT PRIMARY KEY,
+                priority INTEGER NOT NULL DEFAULT 0,
+                weight INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        
+        # PDF 页数清单（页面图片可能被渲染缓存淘汰，页数以此为准；大小或修改时间变化视为替换）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pdf_files (
+                project_id TEXT NOT NULL,
+                machine_id TEXT NOT NULL,
+                page_count INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                PRIMARY KEY (project_id, machine_id)
+            ) WITHOUT ROWID
+        """)
+        
+        # 旧库补充字段
+        _ensure_column(cursor, "submissions", "request_ip", "TEXT")
+        _ensure_column(cursor, "submissions", "request_key", "TEXT")
+        
+        # 旧库：locked_at 曾按本地时间写入，现改为 UTC；升级后首次启动时释放锁定中的任务（只执行一次）
+        # 重启后内存中的租约已不存在，这些锁没有持有者，释放回任务池不影响任何用户
+        cursor.execute("SELECT value FROM config WHERE key = 'locked_at_utc'")
+        if not cursor.fetchone():
+            cursor.execute("""
+                UPDATE tasks SET status = 0, locked_by = NULL, locked_at = NULL
+                WHERE status = 1
+            """)
+            if cursor.rowcount > 0:
+                print(f"[Database] locked_at 改用 UTC，已释放 {cursor.rowcount} 个锁定中的任务")
+            cursor.execute("INSERT INTO config (key, value) VALUES ('locked_at_utc', '1')")
+        
+        # 索引：用户提交记录按时间倒序分页
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_submissions_user_time
+            ON submissions (username, submitted_at DESC, id DESC)
+        """)
+        
+        # 索引：按项目读取提交记录 / 查询最新提交ID
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_submissions_project
+            ON submissions (project_id, id)
+        """)
+        
+        # 索引：按项目顺序分配任务（先各 PDF 第一页，再逐页推进）
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tasks_dispatch
+            ON tasks (project_id, status, page_index, machine_id)
+        """)
+        
+        # 索引：提交幂等键（同一用户内唯一）
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_request_key
+            ON submissions (username, request_key) WHERE request_key IS NOT NULL
+        """)
+        
+        # 提交行表（submissions.data 的逐行展开，与之在同一事务中写入，供 SQL 查询、统计和导出）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS submission_rows (
+                id INTEGER PRIMARY KEY,
+                submission_id INTEGER NOT NULL REFERENCES submissions(id),
+                row_index INTEGER NOT NULL,
+                project_id TEXT NOT NULL,
+                machine_id TEXT NOT NULL,
+                circuit_name TEXT NOT NULL,
+                area TEXT,
+                device_pos TEXT,
+                voltage TEXT,
+                phase_wire TEXT,
+                power TEXT,
+                max_current TEXT,
+                run_current TEXT,
+                machine_switch TEXT,
+                factory_switch TEXT,
+                remark TEXT,
+                UNIQUE(submission_id, row_index)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rows_machine ON submission_rows (machine_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rows_circuit ON submission_rows (circuit_name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rows_area ON submission_rows (area)")
+        
+        # 提交行全文索引：trigram 分词需要 SQLite 3.34+，版本过低时不建索引（检索退化为子串匹配，不影响启动）
+        if sqlite3.sqlite_version_info >= (3, 34, 0):
+            _create_row_fts(cursor)
+        else:
+            print(f"[Database] SQLite {sqlite3.sqlite_version} 不支持 trigram 分词，提交行检索不使用全文索引")
+        
+        # 提交行一二字索引：trigram 无法索引 1~2 个字符的关键词（如"照明"），
+        # 每行检索字段的单字与相邻二字作为词元写入 FTS5（unicode61 分词、detail=none 只记行号），由 Python 计算写入
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'submission_rows_grams'")
+        grams_exists = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS submission_rows_grams USING fts5(
+                grams, tokenize = 'unicode61', detail = 'none'
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS submission_rows_gd AFTER DELETE ON submission_rows BEGIN
+                DELETE FROM submission_rows_grams WHERE rowid = old.id;
+            END
+        """)
+        if not grams_exists:
+            _fill_row_grams(cursor)
+        
         conn.commit()
+    
+    # 旧库：从已有提交记录补齐提交行（只执行一次）
+    backfill_submission_rows()
+
+
+def _ensure_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """为已存在的表补充新增字段（CREATE TABLE IF NOT EXISTS 不会修改旧表）"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_row_fts(cursor: sqlite3.Cursor):
+    """建立提交行全文索引（FTS5 外部内容表，只存索引不存副本，由触发器与 submission_rows 同步）"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'submission_rows_fts'")
+    fts_exists = cursor.fetchone() is not None
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS submission_rows_fts USING fts5(
+            {", ".join(SEARCH_FIELDS)},
+            content = 'submission_rows', content_rowid = 'id', tokenize = 'trigram'
+        )
+    """)
+    columns = ", ".join(SEARCH_FIELDS)
+    new_values = ", ".join("new." + field for field in SEARCH_FIELDS)
+    old_values = ", ".join("old." + field for field in SEARCH_FIELDS)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS submission_rows_ai AFTER INSERT ON submission_rows BEGIN
+            INSERT INTO submission_rows_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS submission_rows_ad AFTER DELETE ON submission_rows BEGIN
+            INSERT INTO submission_rows_fts (submission_rows_fts, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS submission_rows_au AFTER UPDATE ON submission_rows BEGIN
+            INSERT INTO submission_rows_fts (submission_rows_fts, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+            INSERT INTO submission_rows_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    if not fts_exists:
+        # 新建索引时为已有的提交行建立索引
+        cursor.execute("INSERT INTO submission_rows_fts (submission_rows_fts) VALUES ('rebuild')")
+
+
+def _row_grams(values: Iterable[Any]) -> str:
+    """提交行检索字段的单字与相邻二字（空格分隔，写入 submission_rows_grams）"""
+    grams = set()
+    for value in values:
+        text = str(value) if value is not None else ""
+        grams.update(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return " ".join(gram for gram in grams if any(ch.isalnum() for ch in gram))
+
+
+def _fill_row_grams(cursor: sqlite3.Cursor):
+    """为还没有一二字索引的提交行建立索引（新建索引表、从历史提交补齐行之后）"""
+    cursor.execute(f"""
+        SELECT id, {", ".join(SEARCH_FIELDS)} FROM submission_rows
+        WHERE id NOT IN (SELECT rowid FROM submission_rows_grams)
+    """)
+    rows = cursor.fetchall()
+    cursor.executemany(
+        "INSERT INTO submission_rows_grams (rowid, grams) VALUES (?, ?)",
+        [(row[0], _row_grams(row[1:])) for row in rows]
+    )
 
 
 def sync_users_from_file():
@@ -77,7 +289,7 @@ def sync_users_from_file():
 @contextmanager
 def get_db():
     """获取数据库连接的上下文管理器"""
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False, factory=_TimedConnection)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -85,6 +297,106 @@ def get_db():
         conn.close()
 
 
+@contextmanager
+def transaction():
+    """
+    单事务上下文：开始时即获取写锁，正常退出提交一次，异常时整体回滚
+    多个写操作放在同一个 with 块中，只需一次提交（一次 fsync），中途崩溃不会留下半完成的状态
+    """
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def _observe(sql: str, elapsed: float):
+    """记录语句耗时"""
+    kind = sql.lstrip()[:6].upper()
+    _QUERY_SECONDS.observe(elapsed, kind if kind in _STATEMENT_KINDS else "OTHER")
+
+
+def _record_slow_query(conn: sqlite3.Connection, sql: str, parameters, elapsed: float):
+    """
+    记录慢查询并打印日志
+    用同一连接和参数执行 EXPLAIN QUERY PLAN，拿到的是这次实际使用的计划
+    """
+    statement = " ".join(sql.split())
+    plan: Optional[List[str]] = None
+    if parameters is not None:
+        try:
+            rows = conn.cursor(sqlite3.Cursor).execute(
+                "EXPLAIN QUERY PLAN " + sql, parameters
+            ).fetchall()
+            plan = [row[3] for row in rows]
+        except sqlite3.Error:
+            pass
+    
+    with _slow_lock:
+        _slow_queries.append({
+            "sql": statement,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "plan": plan
+        })
+    
+    print(f"[Database] 慢查询 {elapsed * 1000:.1f}ms: {statement[:200]}")
+    if plan:
+        print(f"[Database] 执行计划: {' | '.join(plan)}")
+
+
+def get_slow_queries(limit: int = SLOW_QUERY_LOG_SIZE) -> List[dict]:
+    """获取记录的慢查询，按耗时降序"""
+    with _slow_lock:
+        entries = list(_slow_queries)
+    entries.sort(key=lambda e: e["elapsed_ms"], reverse=True)
+    return entries[:limit]
+
+
+def clear_slow_queries():
+    """清空慢查询记录"""
+    with _slow_lock:
+        _slow_queries.clear()
+
+
+class _TimedCursor(sqlite3.Cursor):
+    """记录 execute / executemany 耗时的游标，超过阈值的语句记入慢查询"""
+    
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            _observe(sql, elapsed)
+            if elapsed >= SLOW_QUERY_THRESHOLD:
+                _record_slow_query(self.connection, sql, parameters, elapsed)
+    
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            _observe(sql, elapsed)
+            if elapsed >= SLOW_QUERY_THRESHOLD:
+                # 参数序列可能是已耗尽的迭代器，不再取执行计划
+                _record_slow_query(self.connection, sql, None, elapsed)
+
+
+class _TimedConnection(sqlite3.Connection):
+    """默认使用 _TimedCursor 的连接"""
+    
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
 # ========== 系统初始化相关 ==========
 
 def is_system_initialized() -> bool:
@@ -200,17 +512,6 @@ def get_user_by_token(token: str) -> Optional[Dict[str, Any]]:
         return dict(row) if row else None
 
 
-def increment_contribution(username: str):
-    """增加用户贡献值"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET contribution = contribution + 1 WHERE username = ?",
-            (username,)
-        )
-        conn.commit()
-
-
 # ========== 任务相关 ==========
 
 def upsert_task(project_id: str, machine_id: str, page_index: int):
@@ -225,59 +526,248 @@ def upsert_task(project_id: str, machine_id: str, page_index: int):
         conn.commit()
 
 
-def get_existing_tasks() -> set:
-    """获取数据库中所有任务的key集合"""
-    with get_db() as conn:
+def sync_tasks(found_tasks: Iterable[Tuple[str, str, int]]) -> Tuple[int, int, List[int]]:
+    """
+    按扫描结果同步任务表（单事务）
+    扫描到的任务键先批量写入临时表，再用两条集合语句插入新任务、删除孤立任务（PDF 已删除且未完成），
+    不受 SQLite 参数个数限制；孤立任务中锁定中的任务ID一并返回，由调用方通知持有者
+    :return: (新增任务数, 删除的孤立任务数, 删除的锁定中任务ID)
+    """
+    with transaction() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT project_id, machine_id, page_index FROM tasks")
-        return {(row[0], row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS found_tasks (
+                project_id TEXT NOT NULL,
+                machine_id TEXT NOT NULL,
+                page_index INTEGER NOT NULL,
+                PRIMARY KEY (project_id, machine_id, page_index)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("DELETE FROM found_tasks")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO found_tasks (project_id, machine_id, page_index) VALUES (?, ?, ?)",
+            found_tasks
+        )
+        
+        cursor.execute("""
+            INSERT INTO tasks (project_id, machine_id, page_index, status)
+            SELECT project_id, machine_id, page_index, 0 FROM found_tasks WHERE true
+            ON CONFLICT(project_id, machine_id, page_index) DO NOTHING
+        """)
+        new_count = cursor.rowcount
+        
+        # 孤立任务：扫描结果中没有的页面（同一事务内先取锁定中的ID再删除，不依赖 SQLite 3.35 的 RETURNING）
+        orphan = """
+            NOT EXISTS (
+                SELECT 1 FROM found_tasks f
+                WHERE f.project_id = tasks.project_id
+                  AND f.machine_id = tasks.machine_id
+                  AND f.page_index = tasks.page_index
+            )
+        """
+        cursor.execute(f"SELECT id FROM tasks WHERE status = 1 AND {orphan}")
+        locked_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"DELETE FROM tasks WHERE status != 2 AND {orphan}")
+        orphan_count = cursor.rowcount
+        
+        cursor.execute("DROP TABLE found_tasks")
+        return new_count, orphan_count, locked_ids
 
 
-def remove_orphan_tasks(valid_tasks: set) -> int:
-    """删除不在valid_tasks中且未完成的孤立任务"""
+def get_pdf_manifest() -> Dict[Tuple[str, str], Tuple[int, int, float]]:
+    """获取 PDF 页数清单 (project_id, machine_id) -> (页数, 文件大小, 修改时间)"""
     with get_db() as conn:
         cursor = conn.cursor()
-        # 获取所有未完成的任务
-        cursor.execute("SELECT id, project_id, machine_id, page_index FROM tasks WHERE status != 2")
-        orphans = []
-        for row in cursor.fetchall():
-            task_key = (row[1], row[2], row[3])
-            if task_key not in valid_tasks:
-                orphans.append(row[0])
+        cursor.execute("SELECT project_id, machine_id, page_count, size, mtime FROM pdf_files")
+        return {(row[0], row[1]): (row[2], row[3], row[4]) for row in cursor.fetchall()}
+
+
+def sync_pdf_tasks(
+    project_id: str,
+    machine_id: str,
+    page_count: int,
+    size: int = 0,
+    mtime: float = 0
+) -> Tuple[int, int, List[int]]:
+    """
+    同步单个 PDF 的任务和清单记录（单事务，增量扫描用）
+    补齐缺少的页面任务，删除超出页数的未完成任务；page_count 为 0 表示 PDF 已删除
+    被删除的任务中可能有用户正在处理的，其ID一并返回，由调用方通知持有者
+    :return: (新增任务数, 删除的任务数, 删除的锁定中任务ID)
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO tasks (project_id, machine_id, page_index, status) VALUES (?, ?, ?, 0)
+            ON CONFLICT(project_id, machine_id, page_index) DO NOTHING
+        """, [(project_id, machine_id, page_index) for page_index in range(page_count)])
+        new_count = max(cursor.rowcount, 0)
         
-        if orphans:
-            cursor.execute(f"DELETE FROM tasks WHERE id IN ({','.join('?' * len(orphans))})", orphans)
-            conn.commit()
+        cursor.execute("""
+            SELECT id FROM tasks
+            WHERE project_id = ? AND machine_id = ? AND page_index >= ? AND status = 1
+        """, (project_id, machine_id, page_count))
+        locked_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            DELETE FROM tasks
+            WHERE project_id = ? AND machine_id = ? AND page_index >= ? AND status != 2
+        """, (project_id, machine_id, page_count))
+        removed_count = cursor.rowcount
         
-        return len(orphans)
+        if page_count:
+            cursor.execute("""
+                INSERT INTO pdf_files (project_id, machine_id, page_count, size, mtime) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(project_id, machine_id) DO UPDATE SET
+                    page_count = excluded.page_count, size = excluded.size, mtime = excluded.mtime
+            """, (project_id, machine_id, page_count, size, mtime))
+        else:
+            cursor.execute(
+                "DELETE FROM pdf_files WHERE project_id = ? AND machine_id = ?",
+                (project_id, machine_id)
+            )
+        return new_count, removed_count, locked_ids
+
 
+def save_pdf_manifest(records: Iterable[Tuple[str, str, int, int, float]]):
+    """用完整扫描结果替换 PDF 页数清单 (project_id, machine_id, 页数, 文件大小, 修改时间)"""
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM pdf_files")
+        cursor.executemany(
+            "INSERT INTO pdf_files (project_id, machine_id, page_count, size, mtime) VALUES (?, ?, ?, ?, ?)",
+            records
+        )
 
-def fetch_available_task(timeout_seconds: int = 10, project_id: str = None) -> Optional[Dict[str, Any]]:
-    """获取可用任务（未处理或超时的僵尸任务）"""
+
+def update_pdf_manifest(records: Iterable[Tuple[str, str, int, int, float]]):
+    """更新部分 PDF 的清单记录，不影响其他记录（扫描中途取消时保存已处理的 PDF）"""
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO pdf_files (project_id, machine_id, page_count, size, mtime) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(project_id, machine_id) DO UPDATE SET
+                page_count = excluded.page_count, size = excluded.size, mtime = excluded.mtime
+        """, records)
+
+
+def fetch_available_task(
+    timeout_seconds: int = 10, project_id: str = None, exclude: Iterable[int] = ()
+) -> Optional[Dict[str, Any]]:
+    """
+    获取可用任务（未处理或超时的僵尸任务）
+    :param exclude: 跳过的任务ID（本次领取中已尝试过的）
+    """
+    exclude = list(exclude)
+    exclude_sql = f" AND id NOT IN ({','.join('?' * len(exclude))})" if exclude else ""
+    
     with get_db() as conn:
         cursor = conn.cursor()
         
         if project_id:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT * FROM tasks 
                 WHERE (status = 0 OR (status = 1 AND datetime(locked_at, '+' || ? || ' seconds') < datetime('now')))
-                  AND project_id = ?
+                  AND project_id = ?{exclude_sql}
                 ORDER BY RANDOM()
                 LIMIT 1
-            """, (timeout_seconds, project_id))
+            """, (timeout_seconds, project_id, *exclude))
         else:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT * FROM tasks 
-                WHERE status = 0 
-                   OR (status = 1 AND datetime(locked_at, '+' || ? || ' seconds') < datetime('now'))
+                WHERE (status = 0 
+                   OR (status = 1 AND datetime(locked_at, '+' || ? || ' seconds') < datetime('now'))){exclude_sql}
                 ORDER BY RANDOM()
                 LIMIT 1
-            """, (timeout_seconds,))
+            """, (timeout_seconds, *exclude))
         
         row = cursor.fetchone()
         return dict(row) if row else None
 
 
+def fetch_ready_tasks(
+    project_id: str,
+    after: Optional[Tuple[int, str]] = None,
+    limit: int = 200
+) -> List[Dict[str, Any]]:
+    """
+    按分配顺序批量取项目的未处理任务（走 idx_tasks_dispatch）
+    按页码、机台排序，使不同用户从不同 PDF 的第一页开始
+    :param after: 上一批最后一个任务的 (页码, 机台)，从其后继续读取
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if after is None:
+            cursor.execute("""
+                SELECT id, project_id, machine_id, page_index FROM tasks
+                WHERE project_id = ? AND status = 0
+                ORDER BY page_index, machine_id
+                LIMIT ?
+            """, (project_id, limit))
+        else:
+            cursor.execute("""
+                SELECT id, project_id, machine_id, page_index FROM tasks
+                WHERE project_id = ? AND status = 0 AND (page_index, machine_id) > (?, ?)
+                ORDER BY page_index, machine_id
+                LIMIT ?
+            """, (project_id, after[0], after[1], limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def fetch_expired_task(project_id: str, timeout_seconds: int = 10) -> Optional[Dict[str, Any]]:
+    """取项目中锁定超时的僵尸任务（服务重启等原因未释放的任务）"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM tasks
+            WHERE project_id = ? AND status = 1 AND locked_at < datetime('now', ?)
+            LIMIT 1
+        """, (project_id, f"-{int(timeout_seconds)} seconds"))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def get_expired_projects(timeout_seconds: int = 10) -> List[str]:
+    """有锁定超时僵尸任务的项目（这些任务不计入可领取数，项目可能不在可用列表中）"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT project_id FROM tasks
+            WHERE status = 1 AND locked_at < datetime('now', ?)
+        """, (f"-{int(timeout_seconds)} seconds",))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_task_by_key(project_id: str, machine_id: str, page_index: int) -> Optional[Dict[str, Any]]:
+    """通过 (项目, 机台, 页码) 获取任务（走唯一索引）"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT * FROM tasks WHERE project_id = ? AND machine_id = ? AND page_index = ?",
+            (project_id, machine_id, page_index)
+        )
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def get_project_schedules() -> Dict[str, Tuple[int, int]]:
+    """获取项目调度配置 project_id -> (优先级, 权重)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT project_id, priority, weight FROM project_schedule")
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+def set_project_schedule(project_id: str, priority: int, weight: int):
+    """设置项目调度配置"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO project_schedule (project_id, priority, weight) VALUES (?, ?, ?)
+            ON CONFLICT(project_id) DO UPDATE SET priority = excluded.priority, weight = excluded.weight
+        """, (project_id, priority, weight))
+        conn.commit()
+
+
 def get_available_projects() -> list:
     """获取有可用任务的项目列表"""
     with get_db() as conn:
@@ -319,18 +809,39 @@ def get_user_locked_task(username: str) -> Optional[Dict[str, Any]]:
         return dict(row) if row else None
 
 
-def lock_task(task_id: int, username: str) -> bool:
-    """锁定任务"""
+def lock_task(task_id: int, username: str, timeout_seconds: int = 10) -> bool:
+    """
+    锁定任务（locked_at 使用 UTC，与僵尸任务判断的 datetime('now') 一致）
+    只在任务仍可领取（未处理或已超时）时成功，并发领取同一任务时只有一人成功
+    """
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            UPDATE tasks SET status = 1, locked_by = ?, locked_at = ?
+            UPDATE tasks SET status = 1, locked_by = ?, locked_at = CURRENT_TIMESTAMP
             WHERE id = ?
-        """, (username, datetime.now(), task_id))
+              AND (status = 0 OR (status = 1 AND locked_at < datetime('now', ?)))
+        """, (username, task_id, f"-{int(timeout_seconds)} seconds"))
         conn.commit()
         return cursor.rowcount > 0
 
 
+def renew_leases(task_ids: list) -> int:
+    """批量续租：刷新锁定中任务的 locked_at，一次事务完成"""
+    renewed = 0
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # 分块避免超过 SQLite 参数数量上限
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            cursor.execute(f"""
+                UPDATE tasks SET locked_at = CURRENT_TIMESTAMP
+                WHERE status = 1 AND id IN ({','.join('?' * len(chunk))})
+            """, chunk)
+            renewed += cursor.rowcount
+        conn.commit()
+    return renewed
+
+
 def unlock_task(task_id: int):
     """解锁任务（释放回池）"""
     with get_db() as conn:
@@ -342,14 +853,6 @@ def unlock_task(task_id: int):
         conn.commit()
 
 
-def complete_task(task_id: int):
-    """完成任务"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET status = 2 WHERE id = ?", (task_id,))
-        conn.commit()
-
-
 def get_task_by_id(task_id: int) -> Optional[Dict[str, Any]]:
     """通过ID获取任务"""
     with get_db() as conn:
@@ -361,29 +864,153 @@ def get_task_by_id(task_id: int) -> Optional[Dict[str, Any]]:
 
 # ========== 提交记录相关 ==========
 
-def save_submission(task_id: int, project_id: str, machine_id: str, page_index: int, username: str, data: str):
-    """保存提交记录"""
+def get_submission_id_by_request_key(username: str, request_key: str) -> Optional[int]:
+    """通过幂等键查找用户已保存的提交记录ID"""
     with get_db() as conn:
         cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id FROM submissions WHERE username = ? AND request_key = ?",
+            (username, request_key)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+def commit_submission(
+    task_id: int, project_id: str, machine_id: str, page_index: int,
+    username: str, rows: List[Dict[str, Any]], request_ip: str = None, request_key: str = None
+) -> Optional[int]:
+    """
+    提交作业（单事务）：完成任务、保存提交记录及各行、增加贡献值
+    新的提交ID同时推进项目数据水位，已生成的 Excel 随之过期，下载时重新生成
+    任务已不被该用户锁定（如被管理员强制解锁、已被他人领取）时不做任何修改，返回 None
+    带幂等键且该键已提交过时，直接返回原提交记录ID，不重复任何修改
+    :return: 提交记录ID
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        if request_key:
+            cursor.execute(
+                "SELECT id FROM submissions WHERE username = ? AND request_key = ?",
+                (username, request_key)
+            )
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+        
+        cursor.execute(
+            "UPDATE tasks SET status = 2 WHERE id = ? AND status = 1 AND locked_by = ?",
+            (task_id, username)
+        )
+        if cursor.rowcount == 0:
+            return None
+        
         cursor.execute("""
-            INSERT INTO submissions (task_id, project_id, machine_id, page_index, username, data)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (task_id, project_id, machine_id, page_index, username, data))
-        conn.commit()
-        return cursor.lastrowid
-
-
-def get_user_submissions(username: str, limit: int = 50) -> list:
-    """获取用户的提交记录"""
-    with get_db() as conn:
+            INSERT INTO submissions (
+                task_id, project_id, machine_id, page_index, username, data, request_ip, request_key
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (task_id, project_id, machine_id, page_index, username, _dump_rows(rows), request_ip, request_key))
+        submission_id = cursor.lastrowid
+        _insert_submission_rows(cursor, submission_id, project_id, rows)
+        
+        cursor.execute(
+            "UPDATE users SET contribution = contribution + 1 WHERE username = ?",
+            (username,)
+        )
+        return submission_id
+
+
+def _dump_rows(rows: List[Dict[str, Any]]) -> str:
+    """行数据序列化为紧凑 JSON（submissions.data，列表接口可原样输出）"""
+    return json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+
+
+def _insert_submission_rows(cursor: sqlite3.Cursor, submission_id: int, project_id: str, rows: List[Dict[str, Any]]):
+    """写入一条提交记录的全部行（调用方负责事务）"""
+    cursor.executemany(f"""
+        INSERT INTO submission_rows (submission_id, row_index, project_id, {", ".join(ROW_FIELDS)})
+        VALUES (?, ?, ?, {", ".join("?" * len(ROW_FIELDS))})
+    """, [
+        (submission_id, row_index, project_id, *(row.get(field) for field in ROW_FIELDS))
+        for row_index, row in enumerate(rows)
+    ])
+    cursor.executemany("""
+        INSERT INTO submission_rows_grams (rowid, grams)
+        SELECT id, ? FROM submission_rows WHERE submission_id = ? AND row_index = ?
+    """, [
+        (_row_grams(row.get(field) for field in SEARCH_FIELDS), submission_id, row_index)
+        for row_index, row in enumerate(rows)
+    ])
+
+
+def backfill_submission_rows(force: bool = False) -> int:
+    """
+    从 submissions.data 补齐 submission_rows（单事务，用 json_each 在 SQL 内展开，不经过 Python）
+    完成后在 config 表记录标记，之后启动不再执行；force 时忽略标记，只补没有行记录的提交
+    :return: 补齐的行数
+    """
+    with transaction() as conn:
         cursor = conn.cursor()
+        if not force:
+            cursor.execute("SELECT value FROM config WHERE key = 'submission_rows_backfilled'")
+            if cursor.fetchone():
+                return 0
+        
+        extracts = ", ".join(f"json_extract(j.value, '$.{field}')" for field in ROW_FIELDS[2:])
+        cursor.execute(f"""
+            INSERT INTO submission_rows (submission_id, row_index, project_id, {", ".join(ROW_FIELDS)})
+            SELECT s.id, CAST(j.key AS INTEGER), s.project_id,
+                   COALESCE(json_extract(j.value, '$.machine_id'), s.machine_id),
+                   COALESCE(json_extract(j.value, '$.circuit_name'), ''),
+                   {extracts}
+            FROM submissions s, json_each(s.data) j
+            WHERE json_valid(s.data)
+              AND NOT EXISTS (SELECT 1 FROM submission_rows r WHERE r.submission_id = s.id)
+        """)
+        count = max(cursor.rowcount, 0)
+        if count:
+            _fill_row_grams(cursor)
+        
         cursor.execute("""
-            SELECT id, task_id, project_id, machine_id, page_index, submitted_at, data
-            FROM submissions
-            WHERE username = ?
-            ORDER BY submitted_at DESC
-            LIMIT ?
-        """, (username, limit))
+            INSERT INTO config (key, value) VALUES ('submission_rows_backfilled', '1')
+            ON CONFLICT(key) DO NOTHING
+        """)
+    
+    if count:
+        print(f"[Database] 已从历史提交补齐 {count} 条提交行")
+    return count
+
+
+def get_user_submissions(
+    username: str,
+    limit: int = 50,
+    before: Optional[Tuple[str, int]] = None,
+    summary: bool = False
+) -> list:
+    """
+    获取用户的提交记录（按 submitted_at, id 倒序的游标分页）
+    :param before: 游标 (submitted_at, id)，只返回排在它之后的记录
+    :param summary: 摘要模式，不返回 data，只返回行数
+    """
+    if summary:
+        columns = "id, task_id, project_id, machine_id, page_index, submitted_at, json_array_length(data) AS row_count"
+    else:
+        columns = "id, task_id, project_id, machine_id, page_index, submitted_at, data"
+    
+    query = f"SELECT {columns} FROM submissions WHERE username = ?"
+    params: list = [username]
+    
+    if before:
+        query += " AND (submitted_at < ? OR (submitted_at = ? AND id < ?))"
+        params.extend([before[0], before[0], before[1]])
+    
+    query += " ORDER BY submitted_at DESC, id DESC LIMIT ?"
+    params.append(limit)
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
         return [dict(row) for row in cursor.fetchall()]
 
 
@@ -400,16 +1027,109 @@ def get_submission_by_id(submission_id: int, username: str) -> Optional[Dict[str
         return dict(row) if row else None
 
 
-def update_submission(submission_id: int, username: str, data: str) -> bool:
-    """更新提交记录"""
+def update_submission(
+    submission_id: int, username: str, rows: List[Dict[str, Any]], request_ip: str = None
+) -> bool:
+    """更新提交记录（提交行重写、项目数据版本递增在同一事务中）"""
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT project_id FROM submissions WHERE id = ? AND username = ?",
+            (submission_id, username)
+        )
+        row = cursor.fetchone()
+        updated = row is not None
+        
+        if updated:
+            cursor.execute("""
+                UPDATE submissions SET data = ?, request_ip = ?, submitted_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (_dump_rows(rows), request_ip, submission_id))
+            cursor.execute("DELETE FROM submission_rows WHERE submission_id = ?", (submission_id,))
+            _insert_submission_rows(cursor, submission_id, row[0], rows)
+            
+            # 递增项目数据版本，使已生成的 Excel 失效
+            cursor.execute("""
+                INSERT INTO project_versions (project_id, edit_version)
+                SELECT project_id, 1 FROM submissions WHERE id = ?
+                ON CONFLICT(project_id) DO UPDATE SET edit_version = edit_version + 1
+            """, (submission_id,))
+        
+        return updated
+
+
+def get_project_watermark(project_id: str) -> Tuple[int, int]:
+    """获取项目数据水位 (最新提交ID, 修改版本)，任一变化说明数据已更新"""
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE submissions SET data = ?, submitted_at = CURRENT_TIMESTAMP
-            WHERE id = ? AND username = ?
-        """, (data, submission_id, username))
-        conn.commit()
-        return cursor.rowcount > 0
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM submissions WHERE project_id = ?", (project_id,))
+        max_submission_id = cursor.fetchone()[0]
+        cursor.execute("SELECT edit_version FROM project_versions WHERE project_id = ?", (project_id,))
+        row = cursor.fetchone()
+        return max_submission_id, row[0] if row else 0
+
+
+def get_distinct_row_values(field: str) -> List[Tuple[str, str, str]]:
+    """提交行中某字段的全部不同取值（不含空值）及其所在的项目和机台：[(项目ID, 机台ID, 值)]"""
+    if field not in ROW_FIELDS:
+        raise ValueError(f"未知字段: {field}")
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT DISTINCT project_id, machine_id, {field} FROM submission_rows
+            WHERE {field} IS NOT NULL AND {field} != ''
+        """)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def iter_project_rows(
+    project_id: str,
+    username: str = None,
+    machine_id: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    batch_size: int = 500
+) -> Iterator[Dict[str, Any]]:
+    """
+    按提交 id、行号顺序流式读取项目的提交行（导出用），每行带所属提交记录的信息
+    日期为 YYYY-MM-DD，包含 start_date 和 end_date 当天；machine_id 按提交记录的机台过滤
+    """
+    query = f"""
+        SELECT s.id, s.project_id, s.machine_id AS task_machine_id, s.page_index, s.username,
+               s.submitted_at, s.request_ip, {", ".join("r." + field for field in ROW_FIELDS)}
+        FROM submissions s
+        JOIN submission_rows r ON r.submission_id = s.id
+        WHERE s.project_id = ?
+    """
+    params: list = [project_id]
+    
+    if username:
+        query += " AND s.username = ?"
+        params.append(username)
+    
+    if machine_id:
+        query += " AND s.machine_id = ?"
+        params.append(machine_id)
+    
+    if start_date:
+        query += " AND s.submitted_at >= date(?)"
+        params.append(start_date)
+    
+    if end_date:
+        query += " AND s.submitted_at < date(?, '+1 day')"
+        params.append(end_date)
+    
+    query += " ORDER BY s.id, r.row_index"
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
 
 
 # ========== 管理员统计相关 ==========
@@ -496,7 +1216,8 @@ def get_all_submissions(limit: int = 100, username: str = None, project_id: str
         cursor = conn.cursor()
         
         query = """
-            SELECT id, task_id, project_id, machine_id, page_index, username, submitted_at, data
+            SELECT id, task_id, project_id, machine_id, page_index, username, submitted_at, data,
+                   json_array_length(data) AS row_count
             FROM submissions
             WHERE 1=1
         """
@@ -517,6 +1238,92 @@ def get_all_submissions(limit: int = 100, username: str = None, project_id: str
         return [dict(row) for row in cursor.fetchall()]
 
 
+def search_submission_rows(keyword: str, project_id: str = None, limit: int = 50) -> list:
+    """
+    全文检索提交行（管理员），多个关键词以空格分隔且须同时命中
+    trigram 分词下 3 个字符及以上的关键词走 FTS5 索引并按相关度排序；
+    更短的关键词（如两个汉字）走一二字索引 submission_rows_grams 找候选行，再按子串精确匹配，
+    只有短关键词时按最新提交排序
+    SQLite 低于 3.34 时没有 trigram 索引（见 init_db），长关键词拆成相邻二字在一二字索引中同时命中后按子串匹配
+    只含标点的关键词没有可索引的字，只能按子串匹配
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'submission_rows_fts'")
+        has_fts = cursor.fetchone() is not None
+        
+        terms = keyword.split()
+        long_terms = [term for term in terms if has_fts and len(term) >= 3]
+        like_terms = [term for term in terms if not (has_fts and len(term) >= 3)]
+        
+        # 没有长关键词时由一二字索引找候选行：短关键词本身（1~2 个字符）或其相邻二字须同时命中
+        # （有长关键词时 trigram 索引已找出候选行，短关键词只逐行按子串匹配）
+        grams = set()
+        for term in like_terms if not long_terms else []:
+            grams.update(term[i:i + 2] for i in range(max(len(term) - 1, 1)))
+        grams_match = " ".join('"' + gram.replace('"', '""') + '"' for gram in sorted(grams)
+                               if any(ch.isalnum() for ch in gram))
+        
+        if long_terms:
+            source = "submission_rows_fts f JOIN submission_rows r ON r.id = f.rowid"
+        elif grams_match:
+            source = "submission_rows_grams g JOIN submission_rows r ON r.id = g.rowid"
+        else:
+            source = "submission_rows r"
+        query = f"""
+            SELECT r.id, r.submission_id, r.row_index, {", ".join("r." + field for field in ROW_FIELDS)},
+                   s.project_id, s.machine_id AS task_machine_id, s.page_index, s.username, s.submitted_at
+            FROM {source}
+            JOIN submissions s ON s.id = r.submission_id
+            WHERE 1=1
+        """
+        params: list = []
+        
+        if long_terms:
+            query += " AND submission_rows_fts MATCH ?"
+            params.append(" ".join('"' + term.replace('"', '""') + '"' for term in long_terms))
+        
+        if grams_match:
+            query += " AND submission_rows_grams MATCH ?"
+            params.append(grams_match)
+        
+        for term in like_terms:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            query += " AND (" + " OR ".join(f"r.{field} LIKE ? ESCAPE '\\'" for field in SEARCH_FIELDS) + ")"
+            params.extend([pattern] * len(SEARCH_FIELDS))
+        
+        if project_id:
+            query += " AND r.project_id = ?"
+            params.append(project_id)
+        
+        if long_terms:
+            query += " ORDER BY f.rank"
+        elif grams_match:
+            query += " ORDER BY g.rowid DESC"
+        else:
+            query += " ORDER BY r.id DESC"
+        query += " LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def get_completed_projects(project_ids: Iterable[str]) -> Set[str]:
+    """给定项目中任务已全部完成的（每个项目两次 idx_tasks_dispatch 索引查找，不扫描整个任务表）"""
+    completed = set()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        for project_id in project_ids:
+            cursor.execute("""
+                SELECT EXISTS (SELECT 1 FROM tasks WHERE project_id = ? AND status = 2)
+                   AND NOT EXISTS (SELECT 1 FROM tasks WHERE project_id = ? AND status < 2)
+            """, (project_id, project_id))
+            if cursor.fetchone()[0]:
+                completed.add(project_id)
+    return completed
+
+
 def get_project_list() -> list:
     """获取项目列表"""
     with get_db() as conn:
@@ -532,13 +1339,18 @@ def get_project_list() -> list:
         return [dict(row) for row in cursor.fetchall()]
 
 
-def force_unlock_task(task_id: int) -> bool:
-    """强制解锁任务"""
-    with get_db() as conn:
+def force_unlock_task(task_id: int) -> Optional[str]:
+    """
+    强制解锁任务
+    :return: 任务所属项目ID，任务不存在或未锁定时返回 None
+    """
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE tasks SET status = 0, locked_by = NULL, locked_at = NULL
             WHERE id = ? AND status = 1
         """, (task_id,))
-        conn.commit()
-        return cursor.rowcount > 0
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute("SELECT project_id FROM tasks WHERE id = ?", (task_id,))
+        return cursor.fetchone()[0]
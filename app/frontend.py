@@ -0,0 +1,151 @@
+"""
+前端静态资源服务
+启动时索引 web/dist 并在内存中预压缩（gzip，安装 brotli 时另有 br），请求时按 Accept-Encoding 选择
+带哈希的 assets/ 文件长期缓存，index.html 等每次用 ETag 协商
+"""
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 值得压缩的类型与最小体积
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json",
+    "image/svg+xml", "application/manifest+json", "application/wasm"
+)
+MIN_COMPRESS_SIZE = 1024
+
+# Vite 构建产物的文件名带内容哈希，可永久缓存
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+class Asset:
+    """单个静态文件及其压缩版本"""
+    __slots__ = ("body", "variants", "media_type", "etag", "cache_control")
+    
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.body = body
+        self.variants: Dict[str, bytes] = {}  # 编码 -> 压缩后内容
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.cache_control = cache_control
+
+
+class FrontendAssets:
+    """web/dist 内存索引"""
+    
+    def __init__(self, dist_dir: Path):
+        self.dist_dir = dist_dir
+        self._assets: Dict[str, Asset] = {}
+        self._load()
+    
+    def _load(self):
+        """遍历构建目录，读取文件并生成压缩版本"""
+        total, compressed = 0, 0
+        for path in sorted(self.dist_dir.rglob("*")):
+            if not path.is_file() or path.suffix in (".gz", ".br"):
+                continue
+            
+            rel = path.relative_to(self.dist_dir).as_posix()
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type == "application/javascript":
+                media_type += "; charset=utf-8"
+            cache_control = IMMUTABLE_CACHE if rel.startswith("assets/") else REVALIDATE_CACHE
+            
+            asset = Asset(path.read_bytes(), media_type, cache_control)
+            if len(asset.body) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+                self._compress(path, asset)
+            
+            self._assets[rel] = asset
+            total += len(asset.body)
+            compressed += min([len(asset.body)] + [len(v) for v in asset.variants.values()])
+        
+        print(f"[Frontend] 已索引 {len(self._assets)} 个文件, {total // 1024}KB -> 压缩后 {compressed // 1024}KB")
+    
+    @staticmethod
+    def _compress(path: Path, asset: Asset):
+        """生成 br / gzip 版本（构建时已有 .br / .gz 文件则直接使用），只保留比原文件小的"""
+        candidates = {}
+        
+        prebuilt_br = path.with_name(path.name + ".br")
+        if prebuilt_br.is_file():
+            candidates["br"] = prebuilt_br.read_bytes()
+        elif brotli is not None:
+            candidates["br"] = brotli.compress(asset.body, quality=11)
+        
+        prebuilt_gz = path.with_name(path.name + ".gz")
+        if prebuilt_gz.is_file():
+            candidates["gzip"] = prebuilt_gz.read_bytes()
+        else:
+            candidates["gzip"] = gzip.compress(asset.body, compresslevel=9, mtime=0)
+        
+        for encoding, data in candidates.items():
+            if len(data) < len(asset.body):
+                asset.variants[encoding] = data
+    
+    def get(self, path: str) -> Optional[Asset]:
+        return self._assets.get(path.lstrip("/"))
+    
+    def response(self, request: Request, path: str) -> Response:
+        """
+        返回文件；不存在的前端路由（如 /admin）回退到 index.html
+        assets/ 下或带扩展名的路径不存在时返回 404，避免部署后旧的哈希文件被当作 HTML 长期缓存
+        """
+        asset = self.get(path)
+        if asset is None and _is_route(path):
+            asset = self.get("index.html")
+        if asset is None:
+            return Response(status_code=404)
+        
+        headers = {
+            "Cache-Control": asset.cache_control,
+            "ETag": asset.etag,
+            "Vary": "Accept-Encoding",
+        }
+        
+        if asset.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        
+        encoding = _choose_encoding(request.headers.get("accept-encoding", ""), asset.variants)
+        body = asset.variants[encoding] if encoding else asset.body
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        if request.method == "HEAD":
+            # 只返回头部，Content-Length 与 GET 一致
+            headers["Content-Length"] = str(len(body))
+            return Response(media_type=asset.media_type, headers=headers)
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+
+def _is_route(path: str) -> bool:
+    """前端路由路径：不在 assets/、api/ 下，且最后一段没有扩展名"""
+    path = path.lstrip("/")
+    return not path.startswith(("assets/", "api/")) and "." not in path.rpartition("/")[2]
+
+
+def _choose_encoding(accept_encoding: str, variants: Dict[str, bytes]) -> Optional[str]:
+    """按客户端支持选择压缩格式，优先 br"""
+    if not variants or not accept_encoding:
+        return None
+    
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    
+    for encoding in ("br", "gzip"):
+        if encoding in variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
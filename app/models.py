@@ -2,7 +2,7 @@
 Pydantic 数据模型
 """
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Union
 
 
 class LoginRequest(BaseModel):
@@ -49,6 +49,7 @@ class RowData(BaseModel):
 class SubmitRequest(BaseModel):
     task_token: str
     rows: List[RowData]
+    request_key: Optional[str] = Field(None, max_length=64, description="幂等键，重试同一次提交时保持不变")
 
 
 class BaseResponse(BaseModel):
@@ -67,9 +68,22 @@ class SubmissionItem(BaseModel):
     data: List[dict]
 
 
+class SubmissionSummaryItem(BaseModel):
+    """提交记录摘要（不含行数据，打开详情时再获取）"""
+    id: int
+    task_id: int
+    project_id: str
+    machine_id: str
+    page_index: int
+    submitted_at: str
+    image: str
+    row_count: int
+
+
 class SubmissionListResponse(BaseModel):
     code: int = 200
-    data: List[SubmissionItem]
+    data: List[Union[SubmissionItem, SubmissionSummaryItem]]
+    next_cursor: Optional[str] = None
 
 
 class SubmissionUpdateRequest(BaseModel):
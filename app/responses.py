@@ -0,0 +1,69 @@
+"""
+JSON 响应
+优先使用 orjson 序列化（未安装时回退标准库）；
+数据库中存储的 JSON 文本可用 RawJSON 包装后原样拼接进响应，不再解析后重新编码
+"""
+import re
+import json
+import secrets
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON（与 JSONResponse 输出一致：不转义中文、无多余空格）"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """默认响应类：使用 dumps 序列化"""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSON:
+    """已编码的 JSON 文本，输出时原样写入"""
+    __slots__ = ("text",)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+
+class RawJSONResponse(JSONResponse):
+    """
+    支持 RawJSON 的响应
+    先把 RawJSON 替换为带随机前缀的占位字符串序列化外层结构，再把占位符替换成原始 JSON 文本
+    """
+    
+    def render(self, content: Any) -> bytes:
+        nonce = secrets.token_hex(8)
+        raws: list = []
+        body = dumps(_substitute(content, nonce, raws))
+        if not raws:
+            return body
+        
+        pattern = re.compile(rb'"\\u0000' + nonce.encode() + rb':(\d+)"')
+        return pattern.sub(lambda m: raws[int(m.group(1))], body)
+
+
+def _substitute(value: Any, nonce: str, raws: list) -> Any:
+    """递归替换 RawJSON 为占位字符串（只遍历 dict / list，不进入 RawJSON 内部）"""
+    if isinstance(value, RawJSON):
+        raws.append(value.text.encode("utf-8"))
+        return f"\x00{nonce}:{len(raws) - 1}"
+    if isinstance(value, dict):
+        return {k: _substitute(v, nonce, raws) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, nonce, raws) for v in value]
+    return value
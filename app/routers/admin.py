@@ -1,18 +1,34 @@
 """
 管理员路由
 """
-import json
+import os
+import tempfile
+from datetime import date
 from fastapi import APIRouter, HTTPException, Depends, Query
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 from typing import Optional
 
 from app.database import (
     get_stats, get_all_users, get_locked_tasks, 
     get_all_submissions, get_project_list, force_unlock_task,
-    get_user_by_token, create_user, delete_user, update_user_password
+    get_user_by_token, create_user, delete_user, update_user_password,
+    get_slow_queries, clear_slow_queries, search_submission_rows, ROW_FIELDS
+)
+from app.services.task_manager import task_manager
+from app.services.scanner import get_task_image
+from app.services.scan_jobs import scan_jobs
+from app.services.availability import project_availability
+from app.services.ready_queue import ready_queues
+from app.services.excel_cache import excel_cache
+from app.services.exporter import (
+    EXPORT_FORMATS, iter_export_records, iter_csv,
+    write_xlsx, write_parquet, parquet_available
 )
-from app.services.scanner import get_task_image, scan_and_init_tasks
 from app.dependencies import get_current_user
+from app.responses import RawJSON, RawJSONResponse
+from app.config import WORK_DIR, EXCEL_BUILD_WAIT
 
 router = APIRouter()
 
@@ -34,6 +50,11 @@ class UpdatePasswordRequest(BaseModel):
     new_password: str
 
 
+class ScheduleRequest(BaseModel):
+    priority: int = 0
+    weight: int = Field(1, ge=1, le=1000)
+
+
 @router.get("/stats")
 async def stats(user: dict = Depends(require_admin)):
     """获取系统统计数据"""
@@ -42,15 +63,41 @@ async def stats(user: dict = Depends(require_admin)):
 
 @router.post("/scan")
 async def scan_projects(user: dict = Depends(require_admin)):
-    """手动扫描work目录，识别新PDF并创建任务"""
-    result = scan_and_init_tasks()
+    """
+    手动扫描work目录，识别新PDF并创建任务
+    扫描在后台执行，立即返回任务信息；已有扫描在进行时返回该扫描
+    """
+    job, created = scan_jobs.submit(user["username"])
     return {
-        "code": 200, 
-        "data": result,
-        "msg": f"扫描完成: {result['scanned']} 个PDF, {result['new_tasks']} 个新任务"
+        "code": 200,
+        "data": job.to_dict(),
+        "msg": "扫描已开始" if created else "已有扫描正在进行"
     }
 
 
+@router.get("/scan/jobs")
+async def list_scan_jobs(user: dict = Depends(require_admin)):
+    """最近的扫描任务"""
+    return {"code": 200, "data": [job.to_dict() for job in scan_jobs.list()]}
+
+
+@router.get("/scan/jobs/{job_id}")
+async def get_scan_job(job_id: str, user: dict = Depends(require_admin)):
+    """扫描任务状态和各项目进度"""
+    job = scan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="扫描任务不存在")
+    return {"code": 200, "data": job.to_dict()}
+
+
+@router.post("/scan/jobs/{job_id}/cancel")
+async def cancel_scan_job(job_id: str, user: dict = Depends(require_admin)):
+    """取消扫描（当前 PDF 处理完后停止，不修改任务表）"""
+    if not scan_jobs.cancel(job_id):
+        raise HTTPException(status_code=400, detail="扫描任务不存在或已结束")
+    return {"code": 200, "msg": "已请求取消"}
+
+
 @router.get("/users")
 async def list_users(user: dict = Depends(require_admin)):
     """获取所有用户列表"""
@@ -65,6 +112,60 @@ async def list_projects(user: dict = Depends(require_admin)):
     return {"code": 200, "data": projects}
 
 
+@router.get("/projects/{project_id}/excel")
+def download_project_excel(project_id: str, user: dict = Depends(require_admin)):
+    """下载项目 data.xlsx（过期时由后台重新生成）"""
+    if not (WORK_DIR / f"work_{project_id}").is_dir():
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    excel_path = excel_cache.get_excel(project_id, EXCEL_BUILD_WAIT)
+    if excel_path is None:
+        return JSONResponse(status_code=202, content={"code": 202, "msg": "Excel 正在生成，请稍后重试"})
+    
+    return FileResponse(
+        excel_path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"{project_id}_data.xlsx"
+    )
+
+
+@router.get("/slow-queries")
+async def list_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    user: dict = Depends(require_admin)
+):
+    """获取最近记录的慢查询（按耗时降序，含执行计划）"""
+    return {"code": 200, "data": get_slow_queries(limit)}
+
+
+@router.delete("/slow-queries")
+async def reset_slow_queries(user: dict = Depends(require_admin)):
+    """清空慢查询记录"""
+    clear_slow_queries()
+    return {"code": 200, "msg": "已清空"}
+
+
+@router.get("/schedule")
+async def list_schedule(user: dict = Depends(require_admin)):
+    """获取各项目调度配置（优先级、权重）及当前调度策略"""
+    settings = task_manager.scheduler.get_settings()
+    projects = []
+    for project in get_project_list():
+        priority, weight = settings.get(project["project_id"], (0, 1))
+        projects.append({"project_id": project["project_id"], "priority": priority, "weight": weight})
+    return {"code": 200, "data": {"scheduler": task_manager.scheduler.name, "projects": projects}}
+
+
+@router.put("/schedule/{project_id}")
+async def update_schedule(project_id: str, req: ScheduleRequest, user: dict = Depends(require_admin)):
+    """设置项目调度配置：优先级高的项目先分配，同优先级按权重比例分配"""
+    if not (WORK_DIR / f"work_{project_id}").is_dir():
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    task_manager.scheduler.set_project(project_id, req.priority, req.weight)
+    return {"code": 200, "msg": "调度配置已更新"}
+
+
 @router.get("/locked-tasks")
 async def list_locked_tasks(user: dict = Depends(require_admin)):
     """获取当前锁定中的任务"""
@@ -75,9 +176,12 @@ async def list_locked_tasks(user: dict = Depends(require_admin)):
 @router.post("/unlock-task/{task_id}")
 async def unlock_task(task_id: int, user: dict = Depends(require_admin)):
     """强制解锁任务"""
-    success = force_unlock_task(task_id)
-    if not success:
+    project_id = force_unlock_task(task_id)
+    if project_id is None:
         raise HTTPException(status_code=400, detail="解锁失败，任务可能不存在或未锁定")
+    
+    ready_queues.mark_changed(project_id)
+    project_availability.adjust(project_id, 1)
     return {"code": 200, "msg": "解锁成功"}
 
 
@@ -103,13 +207,96 @@ async def list_all_submissions(
             "username": sub["username"],
             "submitted_at": sub["submitted_at"],
             "image": image,
-            "data": json.loads(sub["data"]),
-            "row_count": len(json.loads(sub["data"]))
+            "data": RawJSON(sub["data"]),
+            "row_count": sub["row_count"]
+        })
+    
+    return RawJSONResponse({"code": 200, "data": items})
+
+
+@router.get("/search")
+async def search_rows(
+    q: str = Query(..., description="关键词，多个以空格分隔"),
+    project_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user: dict = Depends(require_admin)
+):
+    """全文检索提交行（回路名称、区域、设备位置、备注、机台号），按相关度排序"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="请输入搜索关键词")
+    
+    items = []
+    for row in search_submission_rows(q, project_id, limit):
+        items.append({
+            "submission_id": row["submission_id"],
+            "row_index": row["row_index"],
+            "project_id": row["project_id"],
+            "machine_id": row["task_machine_id"],
+            "page_index": row["page_index"],
+            "username": row["username"],
+            "submitted_at": row["submitted_at"],
+            "image": get_task_image(row["project_id"], row["task_machine_id"], row["page_index"]),
+            "row": {field: row[field] for field in ROW_FIELDS}
         })
     
     return {"code": 200, "data": items}
 
 
+@router.get("/export/{project_id}")
+def export_project(
+    project_id: str,
+    format: str = Query("csv", description="导出格式: csv / xlsx / parquet"),
+    username: Optional[str] = None,
+    machine_id: Optional[str] = None,
+    start_date: Optional[date] = Query(None, description="起始日期（含）"),
+    end_date: Optional[date] = Query(None, description="结束日期（含）"),
+    user: dict = Depends(require_admin)
+):
+    """从数据库流式导出项目提交数据"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式，可用格式: {', '.join(EXPORT_FORMATS)}")
+    
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="服务器未安装 pyarrow，无法导出 Parquet")
+    
+    records = iter_export_records(
+        project_id,
+        username=username,
+        machine_id=machine_id,
+        start_date=start_date.isoformat() if start_date else None,
+        end_date=end_date.isoformat() if end_date else None
+    )
+    
+    ext, media_type = EXPORT_FORMATS[format]
+    filename = f"{project_id}.{ext}"
+    
+    if format == "csv":
+        return StreamingResponse(
+            iter_csv(records),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    # XLSX / Parquet 需要完整文件结构，先写入临时文件再发送
+    fd, tmp_path = tempfile.mkstemp(suffix=f".{ext}")
+    os.close(fd)
+    try:
+        if format == "xlsx":
+            write_xlsx(records, tmp_path)
+        else:
+            write_parquet(records, tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    
+    return FileResponse(
+        tmp_path,
+        media_type=media_type,
+        filename=filename,
+        background=BackgroundTask(os.remove, tmp_path)
+    )
+
+
 @router.post("/users/create")
 async def create_new_user(req: CreateUserRequest, user: dict = Depends(require_admin)):
     """创建新用户"""
@@ -2,7 +2,7 @@
 自动补全路由
 """
 from fastapi import APIRouter, Query
-from typing import List
+from typing import List, Optional
 
 from app.services.autocomplete import get_suggestions, AUTOCOMPLETE_FIELDS
 
@@ -13,13 +13,17 @@ router = APIRouter()
 async def suggest(
     field: str = Query(..., description="字段名"),
     q: str = Query("", description="用户输入的前缀"),
-    limit: int = Query(10, ge=1, le=50, description="返回数量")
+    limit: int = Query(10, ge=1, le=50, description="返回数量"),
+    project_id: Optional[str] = Query(None, description="当前任务的项目ID，优先返回该项目的历史值"),
+    machine_id: Optional[str] = Query(None, description="当前任务的机台ID，优先返回该机台的历史值")
 ) -> dict:
     """
     获取输入建议
     
     支持的字段: circuit_name, area, device_pos, voltage, 
     phase_wire, power, max_current, run_current, machine_switch, factory_switch
+    
+    给出 project_id / machine_id 时依次从机台、项目、全局范围取建议
     """
     if field not in AUTOCOMPLETE_FIELDS:
         return {
@@ -28,7 +32,7 @@ async def suggest(
             "data": []
         }
     
-    suggestions = get_suggestions(field, q, limit)
+    suggestions = get_suggestions(field, q, limit, project_id, machine_id)
     
     return {
         "code": 200,
@@ -1,41 +1,84 @@
 """
 提交记录路由
 """
-import json
-from fastapi import APIRouter, HTTPException, Depends, Request
+import base64
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 
-from app.models import (
-    SubmissionListResponse, SubmissionItem, 
-    SubmissionUpdateRequest, BaseResponse
-)
+from app.models import SubmissionListResponse, SubmissionUpdateRequest, BaseResponse
+from app.responses import RawJSON, RawJSONResponse
 from app.database import get_user_submissions, get_submission_by_id, update_submission
 from app.services.scanner import get_task_image
-from app.services.excel_writer import update_excel_by_submission_id
 from app.dependencies import get_current_user
 
 router = APIRouter()
 
 
+def _encode_cursor(submitted_at: str, submission_id: int) -> str:
+    """将 (submitted_at, id) 编码为不透明游标"""
+    raw = f"{submitted_at}|{submission_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    """解析游标，格式错误时抛出 ValueError"""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        submitted_at, submission_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return submitted_at, int(submission_id)
+    except Exception as e:
+        raise ValueError(cursor) from e
+
+
 @router.get("/list", response_model=SubmissionListResponse)
-async def list_submissions(user: dict = Depends(get_current_user)):
-    """获取当前用户的提交记录"""
-    submissions = get_user_submissions(user["username"])
+async def list_submissions(
+    limit: int = Query(50, ge=1, le=200, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    summary: bool = Query(False, description="摘要模式，不返回行数据"),
+    user: dict = Depends(get_current_user)
+):
+    """获取当前用户的提交记录（游标分页）"""
+    before = None
+    if cursor:
+        try:
+            before = _decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+    
+    # 多取一条用于判断是否还有下一页
+    submissions = get_user_submissions(user["username"], limit + 1, before, summary)
+    has_more = len(submissions) > limit
+    submissions = submissions[:limit]
     
     items = []
     for sub in submissions:
-        image = get_task_image(sub["project_id"], sub["machine_id"], sub["page_index"])
-        items.append(SubmissionItem(
-            id=sub["id"],
-            task_id=sub["task_id"],
-            project_id=sub["project_id"],
-            machine_id=sub["machine_id"],
-            page_index=sub["page_index"],
-            submitted_at=sub["submitted_at"],
-            image=image,
-            data=json.loads(sub["data"])
-        ))
+        item = _submission_item(sub)
+        if summary:
+            item["row_count"] = sub["row_count"] or 0
+        else:
+            item["data"] = RawJSON(sub["data"])
+        items.append(item)
+    
+    next_cursor = None
+    if has_more:
+        last = submissions[-1]
+        next_cursor = _encode_cursor(last["submitted_at"], last["id"])
     
-    return SubmissionListResponse(code=200, data=items)
+    # 行数据直接使用数据库中的 JSON 文本，不解析再编码（字段与 SubmissionListResponse 一致）
+    return RawJSONResponse({"code": 200, "data": items, "next_cursor": next_cursor})
+
+
+def _submission_item(sub: dict) -> dict:
+    """提交记录的公共字段（顺序与 SubmissionItem 一致）"""
+    return {
+        "id": sub["id"],
+        "task_id": sub["task_id"],
+        "project_id": sub["project_id"],
+        "machine_id": sub["machine_id"],
+        "page_index": sub["page_index"],
+        "submitted_at": sub["submitted_at"],
+        "image": get_task_image(sub["project_id"], sub["machine_id"], sub["page_index"]),
+    }
 
 
 @router.get("/{submission_id}")
@@ -45,21 +88,9 @@ async def get_submission(submission_id: int, user: dict = Depends(get_current_us
     if not sub:
         raise HTTPException(status_code=404, detail="记录不存在")
     
-    image = get_task_image(sub["project_id"], sub["machine_id"], sub["page_index"])
-    
-    return {
-        "code": 200,
-        "data": SubmissionItem(
-            id=sub["id"],
-            task_id=sub["task_id"],
-            project_id=sub["project_id"],
-            machine_id=sub["machine_id"],
-            page_index=sub["page_index"],
-            submitted_at=sub["submitted_at"],
-            image=image,
-            data=json.loads(sub["data"])
-        )
-    }
+    item = _submission_item(sub)
+    item["data"] = RawJSON(sub["data"])
+    return RawJSONResponse({"code": 200, "data": item})
 
 
 @router.post("/update", response_model=BaseResponse)
@@ -74,24 +105,12 @@ async def update_submission_data(
         raise HTTPException(status_code=404, detail="记录不存在")
     
     row_dicts = [row.model_dump() for row in req.rows]
-    new_data = json.dumps(row_dicts, ensure_ascii=False)
     
-    # 更新数据库
-    success = update_submission(req.submission_id, user["username"], new_data)
-    if not success:
-        raise HTTPException(status_code=400, detail="更新失败")
-    
-    # 更新 Excel
     client_ip = request.client.host if request.client else "unknown"
-    pdf_path = f"work_{sub['project_id']}/pdf/{sub['machine_id']}.pdf#page{sub['page_index']}"
     
-    update_excel_by_submission_id(
-        sub["project_id"],
-        req.submission_id,
-        row_dicts,
-        pdf_path,
-        client_ip,
-        user["username"]
-    )
+    # 更新数据库（同时使项目 Excel 失效，下载时重新生成）
+    success = update_submission(req.submission_id, user["username"], row_dicts, client_ip)
+    if not success:
+        raise HTTPException(status_code=400, detail="更新失败")
     
     return BaseResponse(code=200, msg="修改成功")
@@ -72,7 +72,8 @@ async def submit_task(
         req.task_token,
         req.rows,
         client_ip,
-        user["username"]
+        user["username"],
+        req.request_key
     )
     
     if not success:
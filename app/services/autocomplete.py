@@ -1,17 +1,24 @@
 """
 自动补全服务
 基于历史提交数据提供输入建议
+除全局索引外，按项目、项目+机台分别建立索引，建议优先取范围最小的，不足时用项目范围补齐；
+项目范围内都没有匹配时才扫描全局索引
 """
 import pandas as pd
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple, Optional
 from collections import defaultdict
 
 from app.config import WORK_DIR
+from app.database import get_distinct_row_values
+from app.services import metrics
 
-# 内存缓存：字段名 -> 历史值集合
+# 内存缓存：字段名 -> 历史值集合（全局）
 _cache: Dict[str, Set[str]] = defaultdict(set)
 
+# 分范围缓存：(项目ID,) 或 (项目ID, 机台ID) -> 字段名 -> 历史值集合
+_scoped: Dict[Tuple[str, ...], Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+
 # 支持补全的字段
 AUTOCOMPLETE_FIELDS = [
     "circuit_name", "area", "device_pos", "voltage", 
@@ -20,10 +27,27 @@ AUTOCOMPLETE_FIELDS = [
 ]
 
 
+def _cache_sizes() -> Dict[Tuple[str, str], int]:
+    """各范围（global / project / machine，后两者为所有项目、机台之和）各字段缓存的候选值数量"""
+    sizes = {("global", field): len(values) for field, values in list(_cache.items())}
+    for scope, fields in list(_scoped.items()):
+        kind = "machine" if len(scope) > 1 else "project"
+        for field, values in list(fields.items()):
+            sizes[(kind, field)] = sizes.get((kind, field), 0) + len(values)
+    return sizes
+
+
+# 运行指标：各范围各字段缓存的候选值数量
+metrics.gauge(
+    "hicore_autocomplete_cache_values", "自动补全缓存的候选值数量", ["scope", "field"]
+).set_function(_cache_sizes)
+
+
 def load_history_from_excel():
     """从所有 Excel 文件加载历史数据到缓存"""
-    global _cache
+    global _cache, _scoped
     _cache = defaultdict(set)
+    _scoped = defaultdict(lambda: defaultdict(set))
     
     if not WORK_DIR.exists():
         return
@@ -38,10 +62,12 @@ def load_history_from_excel():
         
         try:
             df = pd.read_excel(excel_path, sheet_name="DATA")
+            project_id = project_dir.name.replace("work_", "")
             for field in AUTOCOMPLETE_FIELDS:
                 if field in df.columns:
                     values = df[field].dropna().astype(str).unique()
-                    _cache[field].update(v for v in values if v.strip())
+                    for value in values:
+                        add_to_cache(field, value, project_id)
         except Exception as e:
             print(f"[Autocomplete] 加载失败 {excel_path}: {e}")
     
@@ -49,47 +75,109 @@ def load_history_from_excel():
     print(f"[Autocomplete] 已加载 {total} 条历史记录")
 
 
-def add_to_cache(field: str, value: str):
-    """添加新值到缓存"""
+def load_history_from_db():
+    """从数据库提交记录加载历史数据到缓存"""
+    global _cache, _scoped
+    _cache = defaultdict(set)
+    _scoped = defaultdict(lambda: defaultdict(set))
+    
+    for field in AUTOCOMPLETE_FIELDS:
+        for project_id, machine_id, value in get_distinct_row_values(field):
+            add_to_cache(field, value, project_id, machine_id)
+    
+    total = sum(len(v) for v in _cache.values())
+    print(f"[Autocomplete] 已加载 {total} 条历史记录")
+
+
+def add_to_cache(field: str, value: str, project_id: Optional[str] = None, machine_id: Optional[str] = None):
+    """添加新值到缓存（给出项目、机台时同时加入对应范围）"""
     if field in AUTOCOMPLETE_FIELDS and value and value.strip():
-        _cache[field].add(value.strip())
+        value = value.strip()
+        _cache[field].add(value)
+        if project_id:
+            _scoped[(project_id,)][field].add(value)
+            if machine_id:
+                _scoped[(project_id, machine_id)][field].add(value)
 
 
-def add_rows_to_cache(rows: List[dict]):
-    """批量添加提交的数据到缓存"""
+def add_rows_to_cache(rows: List[dict], project_id: Optional[str] = None):
+    """批量添加提交的数据到缓存（机台范围按每行的 machine_id）"""
     for row in rows:
         for field in AUTOCOMPLETE_FIELDS:
             if field in row and row[field]:
-                add_to_cache(field, str(row[field]))
+                add_to_cache(field, str(row[field]), project_id, row.get("machine_id"))
+
+
+def _scopes(field: str, project_id: Optional[str], machine_id: Optional[str]) -> List[Set[str]]:
+    """从小到大的分范围候选集合：机台、项目（未给出或尚无数据的范围跳过，不含全局）"""
+    scopes = []
+    if project_id:
+        if machine_id:
+            scopes.append((project_id, machine_id))
+        scopes.append((project_id,))
+    
+    candidates = []
+    for scope in scopes:
+        values = _scoped[scope].get(field) if scope in _scoped else None
+        if values:
+            candidates.append(values)
+    return candidates
 
 
-def get_suggestions(field: str, prefix: str, limit: int = 10) -> List[str]:
+def _match(values: Set[str], prefix_lower: str) -> List[str]:
+    """前缀匹配 + 包含匹配，前缀匹配优先"""
+    exact_matches = []
+    contains_matches = []
+    
+    for value in values:
+        value_lower = value.lower()
+        if value_lower.startswith(prefix_lower):
+            exact_matches.append(value)
+        elif prefix_lower in value_lower:
+            contains_matches.append(value)
+    
+    return sorted(exact_matches) + sorted(contains_matches)
+
+
+def get_suggestions(
+    field: str,
+    prefix: str,
+    limit: int = 10,
+    project_id: Optional[str] = None,
+    machine_id: Optional[str] = None
+) -> List[str]:
     """
     获取补全建议
+    先在机台范围内匹配，不足 limit 条时用项目范围补齐；
+    两者都没有匹配（或未给出项目）时才在全局范围匹配，避免每次补齐都线性扫描全局缓存
     :param field: 字段名
     :param prefix: 用户输入的前缀
     :param limit: 返回数量限制
+    :param project_id: 当前任务所属项目
+    :param machine_id: 当前任务的机台（需同时给出 project_id）
     :return: 匹配的建议列表
     """
     if field not in AUTOCOMPLETE_FIELDS:
         return []
     
     prefix_lower = prefix.lower().strip()
-    if not prefix_lower:
-        # 无输入时返回最常用的（这里简单返回前N个）
-        return sorted(list(_cache[field]))[:limit]
+    results: List[str] = []
+    seen: Set[str] = set()
     
-    # 前缀匹配 + 包含匹配
-    exact_matches = []  # 前缀匹配优先
-    contains_matches = []
+    for values in _scopes(field, project_id, machine_id):
+        # 无输入时返回最常用的（这里简单返回前N个）
+        matches = _match(values, prefix_lower) if prefix_lower else sorted(values)
+        for value in matches:
+            if value not in seen:
+                seen.add(value)
+                results.append(value)
+                if len(results) >= limit:
+                    return results
     
-    for value in _cache[field]:
-        value_lower = value.lower()
-        if value_lower.startswith(prefix_lower):
-            exact_matches.append(value)
-        elif prefix_lower in value_lower:
-            contains_matches.append(value)
+    if results:
+        return results
     
-    # 合并结果，前缀匹配优先
-    results = sorted(exact_matches) + sorted(contains_matches)
-    return results[:limit]
+    # 分范围内没有匹配，扫描全局缓存
+    values = _cache.get(field, set())
+    matches = _match(values, prefix_lower) if prefix_lower else sorted(values)
+    return matches[:limit]
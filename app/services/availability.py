@@ -0,0 +1,48 @@
+"""
+项目可领取任务计数
+内存维护每个项目的可领取任务数（status = 0），在锁定、释放、扫描时增量更新并推送给在线客户端，
+避免每次轮询都对 tasks 表做 GROUP BY
+"""
+import threading
+from typing import Dict, List
+
+from app.database import get_available_projects
+from app.websocket.hub import hub
+
+
+class ProjectAvailability:
+    """项目可用任务计数（单例）"""
+    
+    def __init__(self):
+        self._counts: Dict[str, int] = {}  # project_id -> 可领取任务数
+        self._lock = threading.Lock()
+    
+    def reload(self):
+        """从数据库重新统计（启动和扫描后调用），并推送完整列表"""
+        counts = {row["project_id"]: row["available_count"] for row in get_available_projects()}
+        with self._lock:
+            self._counts = counts
+        hub.broadcast("projects", self.snapshot())
+    
+    def adjust(self, project_id: str, delta: int):
+        """增量更新某项目的可领取数，并推送变化"""
+        with self._lock:
+            count = max(0, self._counts.get(project_id, 0) + delta)
+            self._counts[project_id] = count
+        
+        hub.broadcast("project_availability", {"project_id": project_id, "available_count": count})
+        if count == 0:
+            hub.broadcast("project_drained", {"project_id": project_id})
+    
+    def snapshot(self) -> List[dict]:
+        """有可领取任务的项目列表（与 get_available_projects 格式一致）"""
+        with self._lock:
+            items = [(p, c) for p, c in self._counts.items() if c > 0]
+        return [
+            {"project_id": project_id, "available_count": count}
+            for project_id, count in sorted(items, reverse=True)
+        ]
+
+
+# 全局单例
+project_availability = ProjectAvailability()
@@ -0,0 +1,134 @@
+"""
+Excel 按需生成服务
+data.xlsx 不再在每次提交/修改时改写，而是在被请求时从数据库生成，
+并以项目数据水位 (最新提交ID, 修改版本) 作为缓存键，只有过期时才由后台线程重建
+"""
+import os
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.config import WORK_DIR, EXCEL_BUILD_WORKERS
+from app.database import get_project_watermark
+from app.services.excel_writer import project_lock, WRITE_SECONDS
+from app.services.exporter import iter_export_records, write_xlsx
+
+
+def get_excel_path(project_id: str) -> Path:
+    """项目 Excel 文件路径"""
+    return WORK_DIR / f"work_{project_id}" / "data.xlsx"
+
+
+def _meta_path(project_id: str) -> Path:
+    """记录 Excel 对应数据水位的元数据文件"""
+    return WORK_DIR / f"work_{project_id}" / "data.meta.json"
+
+
+def _read_watermark(project_id: str) -> Optional[Tuple[int, int]]:
+    """读取已生成 Excel 的数据水位"""
+    try:
+        meta = json.loads(_meta_path(project_id).read_text(encoding="utf-8"))
+        return meta["max_submission_id"], meta["edit_version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def is_excel_fresh(project_id: str) -> bool:
+    """Excel 是否与数据库一致"""
+    if not get_excel_path(project_id).exists():
+        return False
+    return _read_watermark(project_id) == get_project_watermark(project_id)
+
+
+def build_excel(project_id: str) -> Path:
+    """
+    从数据库重新生成项目 Excel
+    先写临时文件再原子替换，读取方不会看到写了一半的文件
+    持有项目写入锁，只阻塞同一项目的其他写入
+    """
+    excel_path = get_excel_path(project_id)
+    excel_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = excel_path.with_name("data.xlsx.tmp")
+    
+    with project_lock(project_id), WRITE_SECONDS.time("build"):
+        # 先记录水位：生成期间的新提交会让下次检查判定为过期
+        max_submission_id, edit_version = get_project_watermark(project_id)
+        
+        write_xlsx(iter_export_records(project_id), tmp_path)
+        os.replace(tmp_path, excel_path)
+        
+        _meta_path(project_id).write_text(json.dumps({
+            "max_submission_id": max_submission_id,
+            "edit_version": edit_version
+        }), encoding="utf-8")
+    
+    return excel_path
+
+
+class ExcelCache:
+    """Excel 缓存管理器（后台线程池重建，同一项目的请求合并，不同项目并行）"""
+    
+    def __init__(self, workers: int = EXCEL_BUILD_WORKERS):
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending: Dict[str, threading.Event] = {}  # project_id -> 重建完成事件
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._worker_count = max(1, workers)
+    
+    def _ensure_worker(self):
+        """按需启动后台线程"""
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self._worker_count:
+            worker = threading.Thread(
+                target=self._run, name=f"excel-cache-{len(self._workers)}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+    
+    def _run(self):
+        """后台线程：依次重建排队的项目"""
+        while True:
+            project_id = self._queue.get()
+            try:
+                if not is_excel_fresh(project_id):
+                    build_excel(project_id)
+                    print(f"[ExcelCache] 已生成: {project_id}")
+            except Exception as e:
+                print(f"[ExcelCache] 生成失败 {project_id}: {e}")
+            finally:
+                with self._lock:
+                    event = self._pending.pop(project_id, None)
+                if event:
+                    event.set()
+    
+    def request_build(self, project_id: str) -> threading.Event:
+        """提交重建请求，同一项目排队中的请求会合并"""
+        with self._lock:
+            event = self._pending.get(project_id)
+            if event is None:
+                event = threading.Event()
+                self._pending[project_id] = event
+                self._queue.put(project_id)
+            self._ensure_worker()
+        return event
+    
+    def get_excel(self, project_id: str, timeout: float) -> Optional[Path]:
+        """
+        获取最新的项目 Excel
+        过期时交给后台线程重建并最多等待 timeout 秒，超时返回 None
+        """
+        if is_excel_fresh(project_id):
+            return get_excel_path(project_id)
+        
+        event = self.request_build(project_id)
+        if not event.wait(timeout):
+            return None
+        
+        path = get_excel_path(project_id)
+        return path if path.exists() else None
+
+
+# 全局单例
+excel_cache = ExcelCache()
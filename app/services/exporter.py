@@ -0,0 +1,120 @@
+"""
+项目数据导出服务
+直接从 submission_rows 表流式生成 CSV / XLSX / Parquet，不读取也不修改 data.xlsx
+"""
+import csv
+import io
+from pathlib import Path
+from typing import Iterator, Dict, Any, List
+
+from openpyxl import Workbook
+
+from app.database import iter_project_rows
+from app.services.excel_writer import COLUMNS
+from app.services.scanner import get_pdf_path
+
+# 支持的导出格式 -> (扩展名, MIME 类型)
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv; charset=utf-8"),
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# 每批写出的行数
+BATCH_SIZE = 500
+
+
+def iter_export_records(project_id: str, **filters) -> Iterator[List[Any]]:
+    """
+    逐行生成导出数据，列顺序与 COLUMNS 一致
+    :param filters: username / machine_id / start_date / end_date
+    """
+    for row in iter_project_rows(project_id, **filters):
+        record: Dict[str, Any] = {
+            **row,
+            "submission_id": row["id"],
+            "pdf_path": get_pdf_path(row["project_id"], row["task_machine_id"], row["page_index"]),
+            "request_ip": row["request_ip"] or "",
+            "request_time": row["submitted_at"],
+        }
+        yield [_cell(record.get(col)) for col in COLUMNS]
+
+
+def _cell(value: Any) -> Any:
+    """空值统一导出为空字符串，与 data.xlsx 保持一致"""
+    return "" if value is None else value
+
+
+def iter_csv(records: Iterator[List[Any]]) -> Iterator[bytes]:
+    """生成 CSV 字节流（带 BOM，Excel 可直接打开中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    buffer.write("\ufeff")
+    writer.writerow(COLUMNS)
+    
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue().encode("utf-8")
+
+
+def write_xlsx(records: Iterator[List[Any]], output_path: Path):
+    """使用只写模式的工作簿写出 XLSX，内存占用与行数无关"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("DATA")
+    ws.append(COLUMNS)
+    for record in records:
+        ws.append(record)
+    wb.save(str(output_path))
+
+
+def write_parquet(records: Iterator[List[Any]], output_path: Path):
+    """
+    分批写出 Parquet（需要安装 pyarrow）
+    除 submission_id 外均按字符串列写出
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema(
+        [pa.field("submission_id", pa.int64())] +
+        [pa.field(col, pa.string()) for col in COLUMNS[1:]]
+    )
+    
+    with pq.ParquetWriter(str(output_path), schema) as writer:
+        batch: List[List[Any]] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                writer.write_table(_to_table(batch, schema))
+                batch = []
+        if batch:
+            writer.write_table(_to_table(batch, schema))
+
+
+def _to_table(batch: List[List[Any]], schema):
+    """将一批行转换为 pyarrow Table"""
+    import pyarrow as pa
+    
+    columns = [
+        [record[0] for record in batch]
+    ] + [
+        [str(record[i]) for record in batch] for i in range(1, len(COLUMNS))
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def parquet_available() -> bool:
+    """检查是否可以导出 Parquet"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
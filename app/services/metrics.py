@@ -0,0 +1,263 @@
+"""
+运行指标收集
+进程内维护计数器、直方图和仪表盘，/metrics 以 Prometheus 文本格式输出
+记录一次指标只做一次加锁和几次加法，不依赖 prometheus_client
+"""
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    """指标基类"""
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+    
+    def _label_str(self, values: LabelValues, extra: str = "") -> str:
+        """生成 {a="x",b="y"} 形式的标签串"""
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def render(self) -> List[str]:
+        """输出本指标的文本行"""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+    
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._label_str(k)} {_fmt(v)}" for k, v in sorted(items)]
+
+
+class Gauge(_Metric):
+    """
+    仪表盘
+    可直接 set，也可以注册回调在输出时读取（回调返回数值，或 标签元组 -> 数值 的字典）
+    """
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable] = None
+    
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = value
+    
+    def set_function(self, function: Callable):
+        self._function = function
+    
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                print(f"[Metrics] 读取 {self.name} 失败: {e}")
+                return []
+            items = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{self._label_str(k)} {_fmt(v)}" for k, v in sorted(items)]
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数..., +Inf 计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+    
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+    
+    def time(self, *label_values: str) -> "_Timer":
+        """计时上下文：with histogram.time("x"): ..."""
+        return _Timer(self, label_values)
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        
+        lines = []
+        for labels, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{self._label_str(labels, le)} {_fmt(cumulative)}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._label_str(labels, le)} {_fmt(cumulative)}")
+            lines.append(f"{self.name}_sum{self._label_str(labels)} {_fmt(series[-1])}")
+            lines.append(f"{self.name}_count{self._label_str(labels)} {_fmt(cumulative)}")
+        return lines
+
+
+class _Timer:
+    """Histogram.time() 返回的计时器"""
+    
+    def __init__(self, histogram: Histogram, label_values: LabelValues):
+        self._histogram = histogram
+        self._label_values = label_values
+        self._start = 0.0
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._label_values)
+        return False
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# ========== 注册表 ==========
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric: _Metric) -> _Metric:
+    """同名指标只注册一次（模块重载时复用已有对象）"""
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge(name, documentation, labels))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labels: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return _register(Histogram(name, documentation, labels, buckets))
+
+
+def render() -> str:
+    """以 Prometheus 文本格式输出全部指标"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ========== HTTP 请求耗时 ==========
+
+HTTP_REQUEST_SECONDS = histogram(
+    "hicore_http_request_duration_seconds", "HTTP 请求耗时", ["router", "method", "status"]
+)
+
+# 按路径前缀划分路由
+_ROUTER_PREFIXES = (
+    ("/api/v1/auth", "auth"),
+    ("/api/v1/task", "task"),
+    ("/api/v1/submission", "submission"),
+    ("/api/v1/admin", "admin"),
+    ("/api/v1/autocomplete", "autocomplete"),
+    ("/static", "static"),
+    ("/metrics", "metrics"),
+)
+
+
+def _router_of(path: str) -> str:
+    for prefix, name in _ROUTER_PREFIXES:
+        if path.startswith(prefix):
+            return name
+    return "frontend"
+
+
+class MetricsMiddleware:
+    """
+    记录每个 HTTP 请求的耗时（纯 ASGI 中间件，不缓冲响应体）
+    WebSocket 连接不计入
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = ["500"]
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, _router_of(scope["path"]), scope["method"], status[0]
+            )
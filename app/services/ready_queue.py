@@ -0,0 +1,183 @@
+"""
+任务就绪队列
+内存中按项目维护可领取任务（status = 0）的队列，按分配顺序从数据库分批加载，低于水位时后台补充
+领取时只需出队加一条条件 UPDATE，不再每次查询 tasks 表；释放、跳过、租约过期的任务放回队列
+队列只是候选来源，任务是否可领取以 lock_task 的条件更新为准，队列中偶有失效项只会多一次失败的 UPDATE
+"""
+import asyncio
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+from app.config import READY_QUEUE_BATCH, READY_QUEUE_LOW_WATERMARK
+from app.database import fetch_ready_tasks
+from app.services.availability import project_availability
+from app.services import metrics
+
+Entry = Tuple[int, str, int]  # (任务ID, 机台, 页码)
+
+
+class ReadyQueues:
+    """按项目的任务就绪队列（单例）"""
+    
+    def __init__(self, batch_size: int = READY_QUEUE_BATCH, low_watermark: int = READY_QUEUE_LOW_WATERMARK):
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self._queues: Dict[str, Deque[Entry]] = {}  # project_id -> 待分配任务
+        self._queued: Dict[str, Set[int]] = {}  # project_id -> 队列中仍有效的任务ID（出队时跳过已移除的）
+        self._cursors: Dict[str, Tuple[int, str]] = {}  # project_id -> 已加载到的 (页码, 机台)
+        self._exhausted: Set[str] = set()  # 数据库中的未处理任务已全部加载的项目
+        self._pending: Set[str] = set()  # 等待后台补充的项目
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    def pop(self, project_id: str) -> Optional[dict]:
+        """
+        取出项目的下一个候选任务
+        队列为空时同步加载一批（首次领取或突发领取耗尽时），仍为空则项目没有未处理任务
+        """
+        with self._lock:
+            entry = self._pop_locked(project_id)
+        if entry is None:
+            self._load(project_id)
+            with self._lock:
+                entry = self._pop_locked(project_id)
+            if entry is None:
+                return None
+        
+        with self._lock:
+            remaining = len(self._queued.get(project_id, ()))
+        if remaining < self.low_watermark:
+            self.request_refill(project_id)
+        
+        task_id, machine_id, page_index = entry
+        return {
+            "id": task_id,
+            "project_id": project_id,
+            "machine_id": machine_id,
+            "page_index": page_index,
+            "status": 0
+        }
+    
+    def _pop_locked(self, project_id: str) -> Optional[Entry]:
+        queue = self._queues.get(project_id)
+        queued = self._queued.get(project_id)
+        while queue:
+            entry = queue.popleft()
+            if entry[0] in queued:
+                queued.remove(entry[0])
+                return entry
+        return None
+    
+    def push(self, project_id: str, task_id: int, machine_id: str, page_index: int, front: bool = True):
+        """任务回到池中（释放放队首优先重新分配，跳过放队尾）"""
+        with self._lock:
+            queue = self._queues.get(project_id)
+            if queue is None:
+                return  # 尚未加载过的项目，领取时会从数据库读到
+            queued = self._queued[project_id]
+            if task_id in queued:
+                return
+            queued.add(task_id)
+            if front:
+                queue.appendleft((task_id, machine_id, page_index))
+            else:
+                queue.append((task_id, machine_id, page_index))
+    
+    def discard(self, project_id: str, task_id: int):
+        """任务已被领取（例如调度器绕过队列直接分配），从队列中移除"""
+        with self._lock:
+            queued = self._queued.get(project_id)
+            if queued:
+                queued.discard(task_id)
+    
+    def mark_changed(self, project_id: str):
+        """项目有任务回到池中但不知道具体位置（如管理员强制解锁），下次补充时重新读取"""
+        with self._lock:
+            self._exhausted.discard(project_id)
+    
+    def reset(self, project_id: Optional[str] = None):
+        """清空队列（扫描后任务集合变化时调用，之后按需重新加载）；指定项目时只清空该项目"""
+        with self._lock:
+            if project_id is None:
+                self._queues.clear()
+                self._queued.clear()
+                self._cursors.clear()
+                self._exhausted.clear()
+                self._pending.clear()
+            else:
+                self._queues.pop(project_id, None)
+                self._queued.pop(project_id, None)
+                self._cursors.pop(project_id, None)
+                self._exhausted.discard(project_id)
+                self._pending.discard(project_id)
+    
+    def _load(self, project_id: str):
+        """
+        从数据库按分配顺序加载下一批未处理任务
+        读到末尾后从头再读，补上游标之前被释放回池的任务；已在队列中的任务不重复加入
+        """
+        with self._lock:
+            after = self._cursors.get(project_id)
+        
+        rows = fetch_ready_tasks(project_id, after, self.batch_size)
+        if not rows and after is not None:
+            after = None
+            rows = fetch_ready_tasks(project_id, None, self.batch_size)
+        
+        with self._lock:
+            queue = self._queues.setdefault(project_id, deque())
+            queued = self._queued.setdefault(project_id, set())
+            for row in rows:
+                if row["id"] not in queued:
+                    queued.add(row["id"])
+                    queue.append((row["id"], row["machine_id"], row["page_index"]))
+            
+            if rows:
+                self._cursors[project_id] = (rows[-1]["page_index"], rows[-1]["machine_id"])
+            else:
+                self._cursors.pop(project_id, None)
+            if len(rows) < self.batch_size:
+                self._exhausted.add(project_id)
+    
+    def request_refill(self, project_id: str):
+        """请求后台补充（已全部加载或已在等待的项目忽略）"""
+        with self._lock:
+            if project_id in self._exhausted or project_id in self._pending:
+                return
+            self._pending.add(project_id)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    async def run_refiller(self):
+        """后台补充：启动时预加载所有有可领取任务的项目，之后按请求补充低于水位的队列"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        for project in project_availability.snapshot():
+            self.request_refill(project["project_id"])
+        
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                pending = list(self._pending)
+                self._pending.clear()
+            for project_id in pending:
+                try:
+                    await asyncio.to_thread(self._load, project_id)
+                except Exception as e:
+                    print(f"[ReadyQueue] 补充 {project_id} 失败: {e}")
+    
+    def sizes(self) -> Dict[Tuple[str, ...], int]:
+        """各项目队列长度（指标输出用）"""
+        with self._lock:
+            return {(project_id,): len(queued) for project_id, queued in self._queued.items()}
+
+
+# 全局单例
+ready_queues = ReadyQueues()
+
+metrics.gauge("hicore_ready_queue_tasks", "内存就绪队列中的任务数", ["project"]).set_function(
+    ready_queues.sizes
+)
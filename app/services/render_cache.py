@@ -0,0 +1,211 @@
+"""
+页面图片缓存
+work/*/tmp 下渲染出的 PNG 作为有总大小上限的磁盘缓存，超出 RENDER_CACHE_MAX_BYTES 时依次淘汰
+已完成项目、闲置项目、其他项目的页面，同一档内先淘汰最久未访问的（LRU）
+被淘汰的页面再次请求时从 PDF 单独渲染该页；页数以数据库中的 PDF 清单为准，不依赖图片是否存在
+"""
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from pdf2image import convert_from_path
+
+from app.config import (
+    WORK_DIR, POPPLER_PATH, RENDER_DPI,
+    RENDER_CACHE_MAX_BYTES, RENDER_CACHE_IDLE_SECONDS
+)
+from app.database import get_completed_projects
+from app.services import metrics
+
+EVICTED_PAGES = metrics.counter("hicore_render_cache_evictions_total", "被淘汰的页面图片数")
+RERENDERED_PAGES = metrics.counter("hicore_render_cache_rerenders_total", "被淘汰后重新渲染的页面数")
+
+
+def poppler_path() -> Optional[str]:
+    """Windows 需要指定 poppler 路径，Linux 使用系统安装的"""
+    return str(POPPLER_PATH) if POPPLER_PATH and POPPLER_PATH.exists() else None
+
+
+def page_path(project_id: str, machine_id: str, page_index: int) -> Path:
+    """页面图片路径（与 get_task_image 的 URL 对应）"""
+    return WORK_DIR / f"work_{project_id}" / "tmp" / f"{machine_id}_{page_index}.png"
+
+
+def parse_page_name(filename: str) -> Optional[Tuple[str, int]]:
+    """从 {machine_id}_{page_index}.png 解析机台和页码（机台名本身可能含下划线）"""
+    if not filename.endswith(".png"):
+        return None
+    machine_id, _, page = filename[:-4].rpartition("_")
+    if not machine_id or not page.isdigit():
+        return None
+    return machine_id, int(page)
+
+
+class RenderCache:
+    """页面图片磁盘缓存（单例）"""
+    
+    def __init__(self, max_bytes: int = RENDER_CACHE_MAX_BYTES, idle_seconds: int = RENDER_CACHE_IDLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._entries: Dict[Path, Tuple[str, int, float]] = {}  # 路径 -> (项目ID, 字节数, 最近访问时间)
+        self._total = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._render_locks: Dict[Path, threading.Lock] = {}
+    
+    def _ensure_loaded(self):
+        """首次使用时索引磁盘上已有的图片，以文件修改时间作为初始访问时间"""
+        with self._lock:
+            if self._loaded:
+                return
+            for path in WORK_DIR.glob("work_*/tmp/*.png"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                project_id = path.parent.parent.name[len("work_"):]
+                self._entries[path] = (project_id, stat.st_size, stat.st_mtime)
+                self._total += stat.st_size
+            self._loaded = True
+        print(f"[RenderCache] 已索引 {len(self._entries)} 张页面图片, 共 {self._total // (1024 * 1024)}MB")
+    
+    def add(self, project_id: str, paths: Iterable[Path]):
+        """登记新渲染的图片"""
+        self._ensure_loaded()
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                size = path.stat().st_size
+                old = self._entries.get(path)
+                if old:
+                    self._total -= old[1]
+                self._entries[path] = (project_id, size, now)
+                self._total += size
+    
+    def remove_machine(self, project_id: str, machine_id: str):
+        """删除某个 PDF 的全部页面图片（PDF 被替换或删除时）"""
+        self._ensure_loaded()
+        tmp_dir = WORK_DIR / f"work_{project_id}" / "tmp"
+        for path in tmp_dir.glob(f"{machine_id}_*.png"):
+            parsed = parse_page_name(path.name)
+            if not parsed or parsed[0] != machine_id:
+                continue
+            path.unlink(missing_ok=True)
+            with self._lock:
+                entry = self._entries.pop(path, None)
+                if entry:
+                    self._total -= entry[1]
+    
+    def get_page(self, project_id: str, machine_id: str, page_index: int) -> Optional[Path]:
+        """
+        获取页面图片并记录访问
+        图片已被淘汰时从 PDF 重新渲染该页（同一页并发请求只渲染一次），PDF 不存在或渲染失败返回 None
+        """
+        self._ensure_loaded()
+        path = page_path(project_id, machine_id, page_index)
+        if self._touch(path):
+            return path
+        
+        pdf_path = WORK_DIR / f"work_{project_id}" / "pdf" / f"{machine_id}.pdf"
+        if not pdf_path.is_file():
+            return None
+        
+        with self._lock:
+            render_lock = self._render_locks.setdefault(path, threading.Lock())
+        with render_lock:
+            if self._touch(path):
+                return path
+            try:
+                images = convert_from_path(
+                    str(pdf_path),
+                    poppler_path=poppler_path(),
+                    dpi=RENDER_DPI,
+                    first_page=page_index + 1,
+                    last_page=page_index + 1
+                )
+                if not images:
+                    return None
+                path.parent.mkdir(parents=True, exist_ok=True)
+                images[0].save(str(path), "PNG")
+            except Exception as e:
+                print(f"[RenderCache] 页面渲染失败 {project_id}/{machine_id} 第 {page_index} 页: {e}")
+                return None
+            finally:
+                with self._lock:
+                    self._render_locks.pop(path, None)
+        
+        RERENDERED_PAGES.inc()
+        self.add(project_id, [path])
+        self.enforce()
+        return path
+    
+    def _touch(self, path: Path) -> bool:
+        """文件存在时更新访问时间（不在索引中的补登记）"""
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return False
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry:
+                self._entries[path] = (entry[0], entry[1], now)
+            else:
+                self._entries[path] = (path.parent.parent.name[len("work_"):], size, now)
+                self._total += size
+        return True
+    
+    def enforce(self):
+        """总大小超出上限时淘汰页面，直到回到上限以内"""
+        if self.max_bytes <= 0:
+            return
+        self._ensure_loaded()
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            items = list(self._entries.items())
+        
+        last_access: Dict[str, float] = {}
+        for _, (project_id, _, accessed) in items:
+            last_access[project_id] = max(accessed, last_access.get(project_id, 0))
+        completed = get_completed_projects(last_access)
+        idle_before = time.time() - self.idle_seconds
+        
+        def rank(item):
+            project_id, _, accessed = item[1]
+            if project_id in completed:
+                tier = 0
+            elif last_access[project_id] < idle_before:
+                tier = 1
+            else:
+                tier = 2
+            return tier, accessed
+        
+        evicted, freed = 0, 0
+        for path, _ in sorted(items, key=rank):
+            with self._lock:
+                if self._total <= self.max_bytes:
+                    break
+                entry = self._entries.pop(path, None)
+                if entry is None:
+                    continue
+                self._total -= entry[1]
+            path.unlink(missing_ok=True)
+            evicted += 1
+            freed += entry[1]
+        
+        if evicted:
+            EVICTED_PAGES.inc(amount=evicted)
+            print(f"[RenderCache] 已淘汰 {evicted} 张页面图片, 释放 {freed // (1024 * 1024)}MB")
+    
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total
+
+
+# 全局单例
+render_cache = RenderCache()
+
+metrics.gauge("hicore_render_cache_bytes", "页面图片缓存占用的磁盘字节数").set_function(
+    render_cache.total_bytes
+)
@@ -0,0 +1,125 @@
+"""
+后台扫描任务
+管理员触发的完整扫描在后台线程中执行，接口立即返回任务ID，可查询进度和取消
+同一时间只运行一个扫描：已有扫描运行时，再次提交返回正在进行的任务
+"""
+import uuid
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.config import SCAN_JOB_HISTORY
+from app.services.scanner import scan_and_init_tasks, ScanCancelled
+from app.services.task_manager import task_manager
+
+# 任务状态
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class ScanJob:
+    """一次扫描任务"""
+    job_id: str
+    submitted_by: str
+    status: str = RUNNING
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    progress: Dict[str, Dict[str, int]] = field(default_factory=dict)  # project_id -> {"done", "total"}
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    
+    def to_dict(self) -> dict:
+        progress = list(self.progress.items())  # 扫描线程可能同时在更新
+        done = sum(p["done"] for _, p in progress)
+        total = sum(p["total"] for _, p in progress)
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "submitted_by": self.submitted_by,
+            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "finished_at": self.finished_at.strftime("%Y-%m-%d %H:%M:%S") if self.finished_at else None,
+            "done": done,
+            "total": total,
+            "projects": [
+                {"project_id": project_id, **counts}
+                for project_id, counts in sorted(progress)
+            ],
+            "cancel_requested": self.cancel_event.is_set(),
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class ScanJobManager:
+    """扫描任务管理器（单例）"""
+    
+    def __init__(self, history: int = SCAN_JOB_HISTORY):
+        self._jobs: "OrderedDict[str, ScanJob]" = OrderedDict()  # 按提交顺序，只保留最近 history 个
+        self._history = max(1, history)
+        self._current: Optional[ScanJob] = None
+        self._lock = threading.Lock()
+    
+    def submit(self, username: str) -> tuple[ScanJob, bool]:
+        """
+        提交扫描
+        :return: (任务, 是否新建)；已有扫描在运行时返回该任务
+        """
+        with self._lock:
+            if self._current is not None:
+                return self._current, False
+            
+            job = ScanJob(job_id=uuid.uuid4().hex[:12], submitted_by=username)
+            self._current = job
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self._history:
+                self._jobs.popitem(last=False)
+        
+        threading.Thread(target=self._run, args=(job,), name=f"scan-{job.job_id}", daemon=True).start()
+        return job, True
+    
+    def _run(self, job: ScanJob):
+        """后台线程：执行扫描并记录结果"""
+        def on_progress(project_id: str, done: int, total: int):
+            job.progress[project_id] = {"done": done, "total": total}
+        
+        try:
+            job.result = scan_and_init_tasks(on_progress, job.cancel_event)
+            job.status = COMPLETED
+            # PDF 已删除的锁定任务：从活跃任务中移除并通知持有者
+            task_manager.drop_removed_tasks(job.result["removed_locked"])
+        except ScanCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            print(f"[ScanJob] 扫描失败 {job.job_id}: {e}")
+        finally:
+            job.finished_at = datetime.now()
+            with self._lock:
+                self._current = None
+    
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        return self._jobs.get(job_id)
+    
+    def list(self) -> List[ScanJob]:
+        """最近的扫描任务（新的在前）"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+    
+    def cancel(self, job_id: str) -> bool:
+        """请求取消（在处理下一个 PDF 之前生效）；任务不存在或已结束返回 False"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status != RUNNING:
+            return False
+        job.cancel_event.set()
+        return True
+
+
+# 全局单例
+scan_jobs = ScanJobManager()
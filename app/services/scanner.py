@@ -2,104 +2,246 @@
 PDF 扫描与图片转换服务
 """
 import os
+import time
+import threading
 from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
 from pdf2image import convert_from_path
 
-from app.config import WORK_DIR, POPPLER_PATH
-from app.database import upsert_task, get_existing_tasks, remove_orphan_tasks
+from app.config import WORK_DIR, RENDER_DPI
+from app.database import sync_tasks, sync_pdf_tasks, get_pdf_manifest, save_pdf_manifest, update_pdf_manifest
+from app.services.availability import project_availability
+from app.services.ready_queue import ready_queues
+from app.services.render_cache import render_cache, poppler_path, parse_page_name
+from app.services import metrics
 
+# 运行指标
+SCAN_SECONDS = metrics.histogram(
+    "hicore_scan_duration_seconds", "完整扫描耗时",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+SCANNED_PDFS = metrics.counter("hicore_scan_pdfs_total", "扫描处理的 PDF 数")
+RENDERED_PAGES = metrics.counter("hicore_scan_rendered_pages_total", "PDF 转图片生成的页数")
+RENDER_SECONDS = metrics.histogram(
+    "hicore_scan_render_duration_seconds", "单个 PDF 转图片耗时",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
 
-def scan_and_init_tasks() -> dict:
+# 完整扫描与增量扫描互斥，避免同一 PDF 被同时转换、任务表被交错同步
+_scan_lock = threading.Lock()
+
+
+class ScanCancelled(Exception):
+    """扫描被取消（尚未同步任务表；已处理 PDF 的清单记录和图片保留，下次扫描直接沿用）"""
+
+
+ProgressCallback = Callable[[str, int, int], None]  # (项目ID, 已处理 PDF 数, 项目 PDF 总数)
+
+
+def scan_and_init_tasks(
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> dict:
     """
     扫描 work 目录，初始化任务并转换 PDF（每页一个任务）
-    返回扫描结果统计
+    返回扫描结果统计；其中 removed_locked 为被删除的锁定中任务ID，调用方需从活跃任务中移除并通知持有者
+    :param on_progress: 每处理完一个 PDF 回调一次（开始时每个项目先回调一次 0）
+    :param cancel_event: 被设置后在下一个 PDF 之前中止，抛出 ScanCancelled
     """
-    result = {"scanned": 0, "new_tasks": 0, "projects": []}
+    with _scan_lock:
+        return _scan_all(on_progress, cancel_event)
+
+
+def _scan_all(on_progress: Optional[ProgressCallback], cancel_event: Optional[threading.Event]) -> dict:
+    """完整扫描（调用方持有 _scan_lock）"""
+    result = {"scanned": 0, "new_tasks": 0, "removed_locked": [], "projects": []}
+    start = time.perf_counter()
     
     if not WORK_DIR.exists():
         WORK_DIR.mkdir(parents=True)
         print("[Scanner] work 目录为空，已创建")
         return result
     
-    # 获取数据库中已有的任务
-    existing_tasks = get_existing_tasks()
-    found_tasks = set()
-    
+    # 先列出全部 PDF，便于报告各项目进度
+    plan = []
     for project_dir in WORK_DIR.iterdir():
         if not project_dir.is_dir() or not project_dir.name.startswith("work_"):
             continue
         
-        project_id = project_dir.name.replace("work_", "")
         pdf_dir = project_dir / "pdf"
-        tmp_dir = project_dir / "tmp"
-        
         if not pdf_dir.exists():
             continue
         
         pdf_files = list(pdf_dir.glob("*.pdf"))
         if not pdf_files:
             continue
-            
+        
+        plan.append((project_dir.name.replace("work_", ""), project_dir / "tmp", pdf_files))
+    
+    if on_progress:
+        for project_id, _, pdf_files in plan:
+            on_progress(project_id, 0, len(pdf_files))
+    
+    found_tasks = []
+    manifest = get_pdf_manifest()
+    records = []
+    
+    for project_id, tmp_dir, pdf_files in plan:
         tmp_dir.mkdir(exist_ok=True)
-        project_tasks = 0
         
-        for pdf_file in pdf_files:
+        for done, pdf_file in enumerate(pdf_files, 1):
+            if cancel_event is not None and cancel_event.is_set():
+                # 只保存已处理 PDF 的清单，任务表留给下次扫描同步
+                update_pdf_manifest(records)
+                print("[Scanner] 扫描已取消")
+                raise ScanCancelled()
+            
             machine_id = pdf_file.stem
             result["scanned"] += 1
+            SCANNED_PDFS.inc()
             
-            images = convert_pdf_to_images(pdf_file, tmp_dir, machine_id)
+            record = _scan_pdf(project_id, pdf_file, tmp_dir, manifest.get((project_id, machine_id)))
+            if record is not None:
+                records.append(record)
+                page_count = record[2]
+                found_tasks.extend((project_id, machine_id, page_index) for page_index in range(page_count))
+                print(f"[Scanner] 已处理: {project_id}/{machine_id}, 共 {page_count} 页")
             
-            for page_index in range(len(images)):
-                task_key = (project_id, machine_id, page_index)
-                found_tasks.add(task_key)
-                
-                # 只有新任务才插入
-                if task_key not in existing_tasks:
-                    upsert_task(project_id, machine_id, page_index)
-                    result["new_tasks"] += 1
-                    project_tasks += 1
-            
-            if images:
-                print(f"[Scanner] 已处理: {project_id}/{machine_id}, 共 {len(images)} 页")
+            if on_progress:
+                on_progress(project_id, done, len(pdf_files))
         
-        if project_tasks > 0 or pdf_files:
-            result["projects"].append(project_id)
+        result["projects"].append(project_id)
     
-    # 清理孤立任务（PDF已删除但数据库还有记录）
-    orphan_count = remove_orphan_tasks(found_tasks)
+    # 一次性插入新任务并清理孤立任务（PDF已删除但数据库还有记录）
+    result["new_tasks"], orphan_count, result["removed_locked"] = sync_tasks(found_tasks)
+    save_pdf_manifest(records)
     if orphan_count > 0:
         print(f"[Scanner] 已清理 {orphan_count} 个孤立任务")
     
+    # 刷新各项目可领取任务数，就绪队列按新的任务集合重新加载
+    project_availability.reload()
+    ready_queues.reset()
+    
+    # 新渲染的页面可能使图片缓存超出上限
+    render_cache.enforce()
+    
+    SCAN_SECONDS.observe(time.perf_counter() - start)
     print(f"[Scanner] 扫描完成: {result['scanned']} 个PDF, {result['new_tasks']} 个新任务")
     return result
 
 
+def scan_pdf_files(pdf_paths: Iterable[Path]) -> dict:
+    """
+    增量扫描：只处理指定的 PDF 文件（新增、替换或删除），供目录监听调用
+    存在的文件按需转换并补齐任务，已删除的文件清理未完成任务和页面图片
+    结果中的 removed_locked 为被删除的锁定中任务ID，调用方需从活跃任务中移除并通知持有者
+    """
+    result = {"scanned": 0, "new_tasks": 0, "removed_tasks": 0, "removed_locked": [], "projects": []}
+    
+    with _scan_lock:
+        manifest = get_pdf_manifest()
+        changed_projects = set()
+        
+        for pdf_file in pdf_paths:
+            project_dir = pdf_file.parent.parent
+            if pdf_file.suffix != ".pdf" or pdf_file.parent.name != "pdf" or not project_dir.name.startswith("work_"):
+                continue
+            
+            project_id = project_dir.name.replace("work_", "")
+            machine_id = pdf_file.stem
+            
+            if pdf_file.is_file():
+                tmp_dir = project_dir / "tmp"
+                tmp_dir.mkdir(exist_ok=True)
+                result["scanned"] += 1
+                SCANNED_PDFS.inc()
+                
+                record = _scan_pdf(project_id, pdf_file, tmp_dir, manifest.get((project_id, machine_id)))
+                if record is None:
+                    continue
+                new_count, removed_count, locked_ids = sync_pdf_tasks(*record)
+                print(f"[Scanner] 已处理: {project_id}/{machine_id}, 共 {record[2]} 页")
+            else:
+                render_cache.remove_machine(project_id, machine_id)
+                new_count, removed_count, locked_ids = sync_pdf_tasks(project_id, machine_id, 0)
+                print(f"[Scanner] PDF 已删除: {project_id}/{machine_id}")
+            
+            result["new_tasks"] += new_count
+            result["removed_tasks"] += removed_count
+            result["removed_locked"].extend(locked_ids)
+            changed_projects.add(project_id)
+        
+        if changed_projects:
+            project_availability.reload()
+            for project_id in changed_projects:
+                ready_queues.reset(project_id)
+            render_cache.enforce()
+        
+        result["projects"] = sorted(changed_projects)
+    
+    print(f"[Scanner] 增量扫描完成: {result['scanned']} 个PDF, "
+          f"新增 {result['new_tasks']} 个任务, 清理 {result['removed_tasks']} 个任务")
+    return result
+
+
+def _scan_pdf(
+    project_id: str,
+    pdf_file: Path,
+    tmp_dir: Path,
+    known: Optional[Tuple[int, int, float]]
+) -> Optional[Tuple[str, str, int, int, float]]:
+    """
+    确定 PDF 页数，需要时转换为图片
+    清单中大小和修改时间未变的 PDF 直接使用记录的页数（图片可能已被缓存淘汰，请求时再渲染）；
+    被替换的 PDF 删除旧图片后重新转换
+    :return: 清单记录 (project_id, machine_id, 页数, 文件大小, 修改时间)，转换失败返回 None
+    """
+    machine_id = pdf_file.stem
+    stat = pdf_file.stat()
+    if known and known[1] == stat.st_size and known[2] == stat.st_mtime:
+        return project_id, machine_id, known[0], stat.st_size, stat.st_mtime
+    
+    if known:
+        render_cache.remove_machine(project_id, machine_id)
+        images = convert_pdf_to_images(pdf_file, tmp_dir, machine_id)
+    else:
+        # 清单建立之前已转换过的 PDF 沿用现有图片
+        images = _existing_images(tmp_dir, machine_id) or convert_pdf_to_images(pdf_file, tmp_dir, machine_id)
+    
+    if not images:
+        return None
+    render_cache.add(project_id, images)
+    return project_id, machine_id, len(images), stat.st_size, stat.st_mtime
+
+
+def _existing_images(tmp_dir: Path, machine_id: str) -> list:
+    """tmp 目录中某个 PDF 已有的页面图片"""
+    return sorted(
+        path for path in tmp_dir.glob(f"{machine_id}_*.png")
+        if (parse_page_name(path.name) or ("",))[0] == machine_id
+    )
+
+
 def convert_pdf_to_images(pdf_path: Path, tmp_dir: Path, machine_id: str) -> list:
     """
     将 PDF 转换为图片
     返回生成的图片路径列表
     """
-    # 检查是否已有缓存
-    existing = list(tmp_dir.glob(f"{machine_id}_*.png"))
-    if existing:
-        return sorted(existing)
-    
     try:
-        # Windows 需要指定 poppler 路径，Linux 使用系统安装的
-        poppler_path = str(POPPLER_PATH) if POPPLER_PATH and POPPLER_PATH.exists() else None
-        
-        images = convert_from_path(
-            str(pdf_path),
-            poppler_path=poppler_path,
-            dpi=150
-        )
-        
-        output_paths = []
-        for i, image in enumerate(images):
-            output_path = tmp_dir / f"{machine_id}_{i}.png"
-            image.save(str(output_path), "PNG")
-            output_paths.append(output_path)
+        with RENDER_SECONDS.time():
+            images = convert_from_path(
+                str(pdf_path),
+                poppler_path=poppler_path(),
+                dpi=RENDER_DPI
+            )
+            
+            output_paths = []
+            for i, image in enumerate(images):
+                output_path = tmp_dir / f"{machine_id}_{i}.png"
+                image.save(str(output_path), "PNG")
+                output_paths.append(output_path)
         
+        RENDERED_PAGES.inc(amount=len(output_paths))
         return output_paths
     
     except Exception as e:
@@ -110,3 +252,8 @@ def convert_pdf_to_images(pdf_path: Path, tmp_dir: Path, machine_id: str) -> lis
 def get_task_image(project_id: str, machine_id: str, page_index: int) -> str:
     """获取任务对应的单张图片URL"""
     return f"/static/work_{project_id}/tmp/{machine_id}_{page_index}.png"
+
+
+def get_pdf_path(project_id: str, machine_id: str, page_index: int) -> str:
+    """获取任务对应的 PDF 路径（含页码），写入 Excel 的 pdf_path 字段"""
+    return f"work_{project_id}/pdf/{machine_id}.pdf#page{page_index}"
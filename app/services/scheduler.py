@@ -0,0 +1,189 @@
+"""
+任务调度策略
+决定下一次领取时依次尝试哪些任务，TaskManager 对候选任务逐个做条件锁定，成功即分配
+- random：与旧版一致，从全部可用任务中随机选择
+- locality：优先分配刚完成页面所在 PDF 的下一页；否则按项目优先级/权重选择项目，在项目内按顺序分配
+"""
+import time
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.config import HEARTBEAT_TIMEOUT, SCHEDULE_STARVATION_SECONDS
+from app.database import (
+    fetch_available_task, fetch_expired_task, get_expired_projects, get_task_by_key,
+    get_project_schedules, set_project_schedule
+)
+from app.services.availability import project_availability
+from app.services.ready_queue import ready_queues
+
+
+class Scheduler:
+    """调度策略基类"""
+    
+    name = ""
+    
+    def __init__(self):
+        self._settings: Optional[Dict[str, Tuple[int, int]]] = None  # project_id -> (优先级, 权重)
+    
+    def get_settings(self) -> Dict[str, Tuple[int, int]]:
+        """项目调度配置（首次使用时从数据库加载，未配置的项目为优先级 0、权重 1）"""
+        if self._settings is None:
+            self._settings = get_project_schedules()
+        return self._settings
+    
+    def set_project(self, project_id: str, priority: int, weight: int):
+        """修改项目优先级和权重"""
+        set_project_schedule(project_id, priority, weight)
+        self._settings = None
+    
+    def candidates(self, username: str, project_id: Optional[str] = None) -> Iterator[dict]:
+        """
+        按优先顺序生成候选任务（每次取值时查询最新状态）
+        同一次领取中不会重复给出同一任务，TaskManager 的每次锁定尝试都用在不同的任务上
+        """
+        raise NotImplementedError
+    
+    def on_assigned(self, username: str, task: dict):
+        """任务分配成功后回调"""
+    
+    def on_completed(self, username: str, project_id: str, machine_id: str, page_index: int):
+        """任务提交成功后回调"""
+
+
+class RandomScheduler(Scheduler):
+    """随机调度（旧版行为）"""
+    
+    name = "random"
+    
+    def candidates(self, username: str, project_id: Optional[str] = None) -> Iterator[dict]:
+        tried: List[int] = []
+        while True:
+            task = fetch_available_task(HEARTBEAT_TIMEOUT, project_id, tried)
+            if task is None:
+                return
+            tried.append(task["id"])
+            yield task
+
+
+class LocalityScheduler(Scheduler):
+    """
+    局部性调度
+    1. 同一 PDF 连续：用户上一个完成的任务是某 PDF 第 n 页时，优先分配第 n+1 页
+    2. 项目选择：超过 SCHEDULE_STARVATION_SECONDS 未分配过的项目优先（防饿死），
+       其余按优先级从高到低，同优先级按权重做平滑加权轮询
+    3. 项目内从就绪队列按 (页码, 机台) 顺序分配，不同用户从不同 PDF 开始，再由规则 1 沿 PDF 推进；
+       队列为空时再找超时未释放的僵尸任务
+    4. 最后尝试只剩僵尸任务的项目（它们不计入可领取数，不在规则 2 的项目列表中）
+    """
+    
+    name = "locality"
+    
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._last_completed: Dict[str, Tuple[str, str, int]] = {}  # username -> 上次完成的任务
+        self._last_served: Dict[str, float] = {}  # project_id -> 上次分配时间
+        self._current_weight: Dict[str, float] = {}  # 平滑加权轮询的当前值
+    
+    def candidates(self, username: str, project_id: Optional[str] = None) -> Iterator[dict]:
+        tried: Set[int] = set()
+        
+        def untried(task: Optional[dict]) -> bool:
+            if task is None or task["id"] in tried:
+                return False
+            tried.add(task["id"])
+            return True
+        
+        # 同一 PDF 的下一页
+        last = self._last_completed.get(username)
+        if last and (project_id is None or last[0] == project_id):
+            task = get_task_by_key(last[0], last[1], last[2] + 1)
+            if task and task["status"] == 0 and untried(task):
+                yield task
+        
+        order = self._project_order(project_id)
+        for pid in order:
+            while True:
+                task = ready_queues.pop(pid)
+                if task is None:
+                    break
+                if untried(task):
+                    yield task
+            
+            task = fetch_expired_task(pid, HEARTBEAT_TIMEOUT)
+            if untried(task):
+                yield task
+        
+        # 只剩僵尸任务的项目（只在前面的候选都失败时才查询）
+        if project_id is None:
+            for pid in get_expired_projects(HEARTBEAT_TIMEOUT):
+                if pid in order:
+                    continue
+                task = fetch_expired_task(pid, HEARTBEAT_TIMEOUT)
+                if untried(task):
+                    yield task
+    
+    def _project_order(self, project_id: Optional[str]) -> List[str]:
+        """本次领取依次尝试的项目"""
+        if project_id:
+            return [project_id]
+        
+        available = [p["project_id"] for p in project_availability.snapshot()]
+        if not available:
+            return []
+        
+        settings = self.get_settings()
+        now = time.monotonic()
+        
+        with self._lock:
+            # 长时间未分配的项目最先尝试，最久未分配的在前
+            starving = sorted(
+                (p for p in available
+                 if now - self._last_served.setdefault(p, now) >= SCHEDULE_STARVATION_SECONDS),
+                key=lambda p: self._last_served[p]
+            )
+            
+            rest = [p for p in available if p not in starving]
+            order: List[str] = []
+            for priority in sorted({settings.get(p, (0, 1))[0] for p in rest}, reverse=True):
+                tier = [p for p in rest if settings.get(p, (0, 1))[0] == priority]
+                order.extend(self._weighted_round_robin(tier, settings))
+        
+        return starving + order
+    
+    def _weighted_round_robin(self, projects: List[str], settings: Dict[str, Tuple[int, int]]) -> List[str]:
+        """
+        平滑加权轮询（调用方持有 _lock）
+        选中项排第一，其余按权重降序作为后备；长期来看各项目被选中的次数与权重成正比
+        """
+        if len(projects) <= 1:
+            return projects
+        
+        weights = {p: max(1, settings.get(p, (0, 1))[1]) for p in projects}
+        total = sum(weights.values())
+        for p in projects:
+            self._current_weight[p] = self._current_weight.get(p, 0) + weights[p]
+        chosen = max(projects, key=lambda p: self._current_weight[p])
+        self._current_weight[chosen] -= total
+        
+        return [chosen] + sorted((p for p in projects if p != chosen), key=lambda p: -weights[p])
+    
+    def on_assigned(self, username: str, task: dict):
+        with self._lock:
+            self._last_served[task["project_id"]] = time.monotonic()
+    
+    def on_completed(self, username: str, project_id: str, machine_id: str, page_index: int):
+        self._last_completed[username] = (project_id, machine_id, page_index)
+
+
+SCHEDULERS = {
+    RandomScheduler.name: RandomScheduler,
+    LocalityScheduler.name: LocalityScheduler,
+}
+
+
+def create_scheduler(name: str) -> Scheduler:
+    """按名称创建调度策略"""
+    if name not in SCHEDULERS:
+        raise ValueError(f"未知的调度策略: {name}，可选: {', '.join(SCHEDULERS)}")
+    return SCHEDULERS[name]()
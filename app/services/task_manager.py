@@ -1,22 +1,34 @@
 """
 任务管理服务
 """
-import json
 import uuid
 import asyncio
+import itertools
 from typing import Dict, Optional
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from app.database import (
-    fetch_available_task, lock_task, unlock_task, 
-    complete_task, get_task_by_id, increment_contribution,
-    save_submission, get_user_locked_task, get_available_projects, get_leaderboard
+    lock_task, unlock_task, 
+    get_task_by_id, commit_submission, get_submission_id_by_request_key,
+    get_user_locked_task, get_leaderboard, renew_leases
 )
 from app.services.scanner import get_task_image
-from app.services.excel_writer import append_to_excel
 from app.services.autocomplete import add_rows_to_cache
-from app.config import HEARTBEAT_TIMEOUT, WORK_DIR
+from app.services.availability import project_availability
+from app.services.ready_queue import ready_queues
+from app.services.scheduler import create_scheduler
+from app.services import metrics
+from app.websocket.hub import hub
+from app.config import (
+    HEARTBEAT_TIMEOUT, LEASE_FLUSH_INTERVAL, WORK_DIR,
+    TASK_SCHEDULER, FETCH_CLAIM_ATTEMPTS
+)
+
+
+def _new_deadline() -> datetime:
+    """新的租约截止时间"""
+    return datetime.now() + timedelta(seconds=HEARTBEAT_TIMEOUT)
 
 
 @dataclass
@@ -28,6 +40,7 @@ class ActiveTask:
     page_index: int
     username: str
     last_heartbeat: datetime = field(default_factory=datetime.now)
+    lease_deadline: datetime = field(default_factory=_new_deadline)  # 心跳续期，过期且无连接则释放
     ws_connected: bool = False
     release_task: Optional[asyncio.Task] = None
 
@@ -37,6 +50,8 @@ class TaskManager:
     
     def __init__(self):
         self._active_tasks: Dict[str, ActiveTask] = {}  # task_token -> ActiveTask
+        self.scheduler = create_scheduler(TASK_SCHEDULER)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 租约维护启动时记录，供后台线程回调
     
     def fetch_task(self, username: str, project_id: str = None) -> Optional[dict]:
         """获取一个可用任务"""
@@ -76,14 +91,23 @@ class TaskManager:
                 "image": image
             }
         
-        # 获取新任务（可指定项目）
-        task = fetch_available_task(HEARTBEAT_TIMEOUT, project_id)
+        # 按调度策略依次尝试候选任务（可指定项目），条件锁定成功即分配
+        # 先截断再取：候选从就绪队列弹出，多取一个就会被丢弃并打乱逐页顺序
+        task = None
+        candidates = self.scheduler.candidates(username, project_id)
+        for candidate in itertools.islice(candidates, FETCH_CLAIM_ATTEMPTS):
+            if lock_task(candidate["id"], username, HEARTBEAT_TIMEOUT):
+                task = candidate
+                break
         if not task:
             return None
         
-        # 锁定任务
-        if not lock_task(task["id"], username):
-            return None
+        ready_queues.discard(task["project_id"], task["id"])
+        self.scheduler.on_assigned(username, task)
+        
+        # 僵尸任务本就不计入可领取数
+        if task["status"] == 0:
+            project_availability.adjust(task["project_id"], -1)
         
         # 生成任务令牌
         task_token = str(uuid.uuid4())
@@ -102,17 +126,22 @@ class TaskManager:
         # 获取单张图片
         image = get_task_image(task["project_id"], task["machine_id"], page_index)
         
-        return {
+        task_data = {
             "task_token": task_token,
             "project_id": task["project_id"],
             "machine_id": task["machine_id"],
             "page_index": page_index,
             "image": image
         }
+        
+        # 用户已有长连接时，心跳由长连接承担，同时通知其他标签页
+        hub.notify_user(username, "task_assigned", task_data)
+        
+        return task_data
     
     def get_available_projects(self) -> list:
-        """获取有可用任务的项目列表"""
-        return get_available_projects()
+        """获取有可用任务的项目列表（内存计数）"""
+        return project_availability.snapshot()
     
     def get_leaderboard(self, limit: int = 10) -> list:
         """获取贡献排行榜"""
@@ -123,15 +152,70 @@ class TaskManager:
         return self._active_tasks.get(task_token)
     
     def update_heartbeat(self, task_token: str):
-        """更新心跳时间"""
+        """更新心跳时间并续期租约（只改内存，由后台批量写回数据库）"""
         if task_token in self._active_tasks:
-            self._active_tasks[task_token].last_heartbeat = datetime.now()
+            active = self._active_tasks[task_token]
+            active.last_heartbeat = datetime.now()
+            active.lease_deadline = _new_deadline()
+    
+    def update_user_heartbeat(self, username: str):
+        """更新用户所有任务的心跳时间（来自用户长连接）"""
+        now = datetime.now()
+        deadline = _new_deadline()
+        for active in self._active_tasks.values():
+            if active.username == username:
+                active.last_heartbeat = now
+                active.lease_deadline = deadline
     
     def set_ws_connected(self, task_token: str, connected: bool):
         """设置 WebSocket 连接状态"""
         if task_token in self._active_tasks:
             self._active_tasks[task_token].ws_connected = connected
     
+    def _is_connected(self, active: ActiveTask) -> bool:
+        """任务是否仍有心跳连接（任务连接或用户长连接）"""
+        return active.ws_connected or hub.is_online(active.username)
+    
+    def _is_live(self, active: ActiveTask, now: datetime) -> bool:
+        """租约是否存活：有心跳连接，或租约尚未过期"""
+        return self._is_connected(active) or active.lease_deadline > now
+    
+    async def run_lease_keeper(self):
+        """
+        后台租约维护
+        每 LEASE_FLUSH_INTERVAL 秒用一条 UPDATE 为所有存活任务刷新 locked_at，
+        使数据库的僵尸判断与内存一致；无连接且租约过期的任务释放回池
+        """
+        self._loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(LEASE_FLUSH_INTERVAL)
+            try:
+                now = datetime.now()
+                live_ids = []
+                for token, active in list(self._active_tasks.items()):
+                    if self._is_live(active, now):
+                        live_ids.append(active.task_id)
+                    elif not (active.release_task and not active.release_task.done()):
+                        # 从未建立连接或心跳中断且没有待执行的释放计划
+                        self.release_task(token)
+                
+                if live_ids:
+                    await asyncio.to_thread(renew_leases, live_ids)
+            except Exception as e:
+                print(f"[TaskManager] 租约维护失败: {e}")
+    
+    def on_session_connected(self, username: str):
+        """用户长连接建立：取消该用户任务的释放计划"""
+        for token, active in list(self._active_tasks.items()):
+            if active.username == username:
+                self.cancel_release(token)
+    
+    async def on_session_closed(self, username: str):
+        """用户长连接断开：没有其他连接时，计划释放该用户的任务"""
+        for token, active in list(self._active_tasks.items()):
+            if active.username == username and not self._is_connected(active):
+                await self.schedule_release(token)
+    
     async def schedule_release(self, task_token: str):
         """计划释放任务（10秒后）"""
         active = self._active_tasks.get(task_token)
@@ -142,12 +226,17 @@ class TaskManager:
         if active.release_task and not active.release_task.done():
             active.release_task.cancel()
         
+        hub.notify_user(active.username, "lease_expiring", {
+            "task_token": task_token,
+            "seconds": HEARTBEAT_TIMEOUT
+        })
+        
         async def delayed_release():
             await asyncio.sleep(HEARTBEAT_TIMEOUT)
             # 再次检查是否重连
             if task_token in self._active_tasks:
                 current = self._active_tasks[task_token]
-                if not current.ws_connected:
+                if not self._is_connected(current):
                     self.release_task(task_token)
         
         active.release_task = asyncio.create_task(delayed_release())
@@ -159,13 +248,50 @@ class TaskManager:
             active.release_task.cancel()
             active.release_task = None
     
-    def release_task(self, task_token: str):
-        """释放任务回池"""
+    def release_task(self, task_token: str, skipped: bool = False):
+        """释放任务回池（放回就绪队列，跳过的任务排到队尾）"""
         active = self._active_tasks.pop(task_token, None)
         if active:
             unlock_task(active.task_id)
+            ready_queues.push(
+                active.project_id, active.task_id, active.machine_id, active.page_index, front=not skipped
+            )
+            project_availability.adjust(active.project_id, 1)
             print(f"[TaskManager] 任务已释放: {active.machine_id}_p{active.page_index}")
     
+    def drop_removed_tasks(self, task_ids: list):
+        """
+        任务所在 PDF 被删除或替换为更少页数时，数据库中的任务已删除：
+        丢弃对应的活跃任务（不再续租、不再释放回池），并通知持有者重新领取
+        可在任意线程调用（完整扫描在后台线程执行），活跃任务只在事件循环中修改
+        """
+        if not task_ids:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is not None and running is not self._loop:
+            self._loop.call_soon_threadsafe(self._drop_removed_tasks, list(task_ids))
+        else:
+            self._drop_removed_tasks(task_ids)
+    
+    def _drop_removed_tasks(self, task_ids: list):
+        """丢弃已删除任务对应的活跃任务并通知持有者（在事件循环中执行）"""
+        removed = set(task_ids)
+        for token, active in list(self._active_tasks.items()):
+            if active.task_id not in removed:
+                continue
+            self.cancel_release(token)
+            del self._active_tasks[token]
+            hub.notify_user(active.username, "task_removed", {
+                "task_token": token,
+                "project_id": active.project_id,
+                "machine_id": active.machine_id,
+                "page_index": active.page_index
+            })
+            print(f"[TaskManager] 任务页面已不存在: {active.machine_id}_p{active.page_index} ({active.username})")
+    
     def skip_task(self, task_token: str, username: str) -> tuple[bool, str]:
         """跳过当前任务"""
         active = self._active_tasks.get(task_token)
@@ -179,7 +305,7 @@ class TaskManager:
         self.cancel_release(task_token)
         
         # 释放任务回池
-        self.release_task(task_token)
+        self.release_task(task_token, skipped=True)
         
         return True, "已跳过任务"
     
@@ -188,9 +314,16 @@ class TaskManager:
         task_token: str, 
         rows: list, 
         request_ip: str,
-        username: str
+        username: str,
+        request_key: Optional[str] = None
     ) -> tuple[bool, str]:
-        """提交任务数据"""
+        """
+        提交任务数据
+        带 request_key 的重试请求：该键已提交成功时直接返回成功，不重复保存、计数和推送
+        """
+        if request_key and get_submission_id_by_request_key(username, request_key) is not None:
+            return True, "提交成功"
+        
         active = self._active_tasks.get(task_token)
         if not active:
             return False, "无效的任务令牌"
@@ -198,47 +331,44 @@ class TaskManager:
         if active.username != username:
             return False, "任务不属于当前用户"
         
-        # 构建 PDF 路径（包含页码）
-        pdf_path = f"work_{active.project_id}/pdf/{active.machine_id}.pdf#page{active.page_index}"
-        
-        # 写入 Excel
         row_dicts = [row.model_dump() for row in rows]
         
-        # 先保存提交记录获取 submission_id
-        submission_id = save_submission(
+        # 完成任务、保存提交记录、增加贡献值在同一事务中（Excel 在下载时按需从数据库生成）
+        submission_id = commit_submission(
             active.task_id,
             active.project_id,
             active.machine_id,
             active.page_index,
             username,
-            json.dumps(row_dicts, ensure_ascii=False)
-        )
-        
-        success = append_to_excel(
-            active.project_id,
-            submission_id,
             row_dicts,
-            pdf_path,
             request_ip,
-            username
+            request_key
         )
         
-        if not success:
-            return False, "数据写入失败"
-        
-        # 更新补全缓存
-        add_rows_to_cache(row_dicts)
-        
-        # 完成任务
-        complete_task(active.task_id)
-        increment_contribution(username)
-        
         # 清理
         self.cancel_release(task_token)
         del self._active_tasks[task_token]
         
+        if submission_id is None:
+            # 任务已被强制解锁或重新分配
+            return False, "任务已失效，请重新领取"
+        
+        # 记录完成位置，下次优先分配同一 PDF 的下一页
+        self.scheduler.on_completed(username, active.project_id, active.machine_id, active.page_index)
+        
+        # 更新补全缓存
+        add_rows_to_cache(row_dicts, active.project_id)
+        
+        # 推送排行榜更新
+        if hub.connection_count():
+            hub.broadcast("leaderboard", get_leaderboard(10))
+        
         return True, "提交成功"
 
 
 # 全局单例
 task_manager = TaskManager()
+
+metrics.gauge("hicore_active_leases", "内存中持有租约的任务数").set_function(
+    lambda: len(task_manager._active_tasks)
+)
@@ -0,0 +1,167 @@
+"""
+PDF 目录监听
+监听 work/work_*/pdf 下 PDF 的新增、替换和删除，等一批复制结束、文件不再变化后，只对变化的文件做增量扫描
+有 watchfiles 时使用系统文件事件（Linux 为 inotify），否则或 PDF_WATCH_MODE = "poll" 时定期比较文件大小和修改时间
+"""
+import time
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, Set, Tuple
+
+from app.config import WORK_DIR, PDF_WATCH_MODE, PDF_WATCH_DEBOUNCE, PDF_WATCH_POLL_INTERVAL
+from app.services.scanner import scan_pdf_files
+from app.services.task_manager import task_manager
+
+try:
+    from watchfiles import watch
+except ImportError:
+    watch = None
+
+
+def is_project_pdf(path: Path) -> bool:
+    """是否为 work/work_{项目ID}/pdf/ 下的 PDF"""
+    return (
+        path.suffix == ".pdf"
+        and path.parent.name == "pdf"
+        and path.parent.parent.name.startswith("work_")
+    )
+
+
+def _is_watched(path: Path) -> bool:
+    """需要关注的路径：项目 PDF，以及项目目录和 pdf 目录本身（新建目录时其中的文件可能早于监听建立）"""
+    return is_project_pdf(path) or path.name.startswith("work_") or (
+        path.name == "pdf" and path.parent.name.startswith("work_")
+    )
+
+
+def _expand(paths: Set[Path]) -> Set[Path]:
+    """目录展开为其中的 PDF"""
+    result = set()
+    for path in paths:
+        if is_project_pdf(path):
+            result.add(path)
+        elif path.name == "pdf":
+            result.update(path.glob("*.pdf"))
+        else:
+            result.update(path.glob("pdf/*.pdf"))
+    return result
+
+
+class PdfWatcher:
+    """PDF 目录监听（单例）"""
+    
+    def __init__(
+        self,
+        mode: str = PDF_WATCH_MODE,
+        debounce: float = PDF_WATCH_DEBOUNCE,
+        poll_interval: float = PDF_WATCH_POLL_INTERVAL
+    ):
+        self.mode = mode
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+    
+    async def run(self):
+        """后台运行：收集变化的文件，静默 debounce 秒且文件写入完成后交给增量扫描"""
+        if self.mode == "off":
+            return
+        
+        changes: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        event_thread = None
+        producer = None
+        if self.mode == "auto" and watch is not None:
+            event_thread = threading.Thread(
+                target=self._watch_events, args=(asyncio.get_running_loop(), changes, stop),
+                name="pdf-watcher", daemon=True
+            )
+            event_thread.start()
+            print("[Watcher] 已启动（文件事件）")
+        else:
+            producer = asyncio.create_task(self._poll(changes))
+            print(f"[Watcher] 已启动（每 {self.poll_interval} 秒轮询）")
+        
+        pending: Set[Path] = set()
+        try:
+            while True:
+                if not pending:
+                    pending |= await changes.get()
+                
+                # 仍有新的变化时继续等待，直到静默 debounce 秒
+                try:
+                    pending |= await asyncio.wait_for(changes.get(), timeout=self.debounce)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                
+                # 还在写入的文件（修改时间太近）留到下一轮
+                pending = _expand(pending)
+                ready = {path for path in pending if self._is_settled(path)}
+                if not ready:
+                    continue
+                pending -= ready
+                
+                try:
+                    result = await asyncio.to_thread(scan_pdf_files, sorted(ready))
+                except Exception as e:
+                    print(f"[Watcher] 增量扫描失败: {e}")
+                    continue
+                
+                # 页面已不存在的锁定任务：从活跃任务中移除并通知持有者
+                if result["removed_locked"]:
+                    task_manager.drop_removed_tasks(result["removed_locked"])
+        finally:
+            if producer is not None:
+                producer.cancel()
+            if event_thread is not None:
+                # 通知监听线程退出并等待，避免进程退出时线程仍在运行
+                stop.set()
+                await asyncio.to_thread(event_thread.join, 2)
+    
+    def _is_settled(self, path: Path) -> bool:
+        """文件已删除，或最近 debounce 秒内没有再被修改"""
+        try:
+            return time.time() - path.stat().st_mtime >= self.debounce
+        except FileNotFoundError:
+            return True
+    
+    @staticmethod
+    def _watch_events(loop: asyncio.AbstractEventLoop, changes: asyncio.Queue, stop: threading.Event):
+        """文件事件来源（独立线程，watchfiles 阻塞等待事件，stop 被设置后退出）"""
+        try:
+            for events in watch(
+                WORK_DIR, watch_filter=lambda _, path: _is_watched(Path(path)), stop_event=stop
+            ):
+                paths = {Path(path) for _, path in events}
+                loop.call_soon_threadsafe(changes.put_nowait, paths)
+        except Exception as e:
+            print(f"[Watcher] 文件事件监听中止: {e}")
+    
+    async def _poll(self, changes: asyncio.Queue):
+        """轮询来源：比较两次快照中各 PDF 的 (大小, 修改时间)"""
+        previous = await asyncio.to_thread(self._snapshot)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await asyncio.to_thread(self._snapshot)
+            changed = {
+                path for path in previous.keys() | current.keys()
+                if previous.get(path) != current.get(path)
+            }
+            previous = current
+            if changed:
+                changes.put_nowait(changed)
+    
+    @staticmethod
+    def _snapshot() -> Dict[Path, Tuple[int, float]]:
+        snapshot = {}
+        for path in WORK_DIR.glob("work_*/pdf/*.pdf"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+
+# 全局单例
+pdf_watcher = PdfWatcher()
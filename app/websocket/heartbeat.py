@@ -3,7 +3,10 @@ WebSocket 心跳保活
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from app.database import get_user_by_token
 from app.services.task_manager import task_manager
+from app.services.availability import project_availability
+from app.websocket.hub import hub
 
 router = APIRouter()
 
@@ -13,11 +16,13 @@ async def heartbeat_ws(websocket: WebSocket, task_token: str):
     """任务心跳 WebSocket"""
     # 验证任务令牌
     active = task_manager.get_active_task(task_token)
+    
+    # 先完成握手再关闭，客户端才能收到 4001；握手前关闭只会得到 HTTP 403（浏览器看到的是 1006）
+    await websocket.accept()
     if not active:
         await websocket.close(code=4001, reason="无效的任务令牌")
         return
     
-    await websocket.accept()
     task_manager.set_ws_connected(task_token, True)
     task_manager.cancel_release(task_token)  # 取消可能存在的释放计划
     
@@ -36,3 +41,43 @@ async def heartbeat_ws(websocket: WebSocket, task_token: str):
         task_manager.set_ws_connected(task_token, False)
         # 启动 10 秒延迟释放
         await task_manager.schedule_release(task_token)
+
+
+@router.websocket("/ws/session")
+async def session_ws(websocket: WebSocket, token: str = ""):
+    """
+    用户长连接：登录后建立一次，承载当前所持任务的心跳和服务端推送
+    客户端发送 ping，服务端回复 pong；推送消息为 JSON {"type": ..., "data": ...}
+    """
+    user = get_user_by_token(token) if token else None
+    
+    # 先完成握手再关闭，客户端据 4001 停止重连
+    await websocket.accept()
+    if not user:
+        await websocket.close(code=4001, reason="无效的Token")
+        return
+    
+    username = user["username"]
+    hub.add(username, websocket)
+    task_manager.on_session_connected(username)
+    
+    print(f"[WS] 会话建立: {username}")
+    
+    try:
+        # 先推送一次完整的项目列表，之后只推送变化
+        await websocket.send_json({"type": "projects", "data": project_availability.snapshot()})
+        
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                task_manager.update_user_heartbeat(username)
+                await websocket.send_text("pong")
+    
+    except (WebSocketDisconnect, RuntimeError):
+        # 客户端已断开时发送会抛出 WebSocketDisconnect 或 RuntimeError，两者都按断开处理
+        print(f"[WS] 会话断开: {username}")
+    
+    finally:
+        hub.remove(username, websocket)
+        # 没有其他连接时启动延迟释放
+        await task_manager.on_session_closed(username)
@@ -0,0 +1,85 @@
+"""
+WebSocket 连接中心
+按用户管理长连接，负责心跳之外的服务端推送（任务分配、租约即将过期、项目已领完、排行榜更新）
+"""
+import asyncio
+from typing import Any, Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from app.services import metrics
+
+
+class ConnectionHub:
+    """用户长连接管理（单例）"""
+    
+    def __init__(self):
+        self._connections: Dict[str, Set[WebSocket]] = {}  # username -> 连接集合（可多标签页）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[asyncio.Task] = set()  # 保持发送任务的引用，避免被回收
+    
+    def add(self, username: str, websocket: WebSocket):
+        """登记连接"""
+        self._loop = asyncio.get_running_loop()
+        self._connections.setdefault(username, set()).add(websocket)
+    
+    def remove(self, username: str, websocket: WebSocket):
+        """移除连接"""
+        sockets = self._connections.get(username)
+        if sockets:
+            sockets.discard(websocket)
+            if not sockets:
+                del self._connections[username]
+    
+    def is_online(self, username: str) -> bool:
+        """用户是否有在线的长连接"""
+        return bool(self._connections.get(username))
+    
+    def connection_count(self) -> int:
+        """当前连接总数"""
+        return sum(len(sockets) for sockets in self._connections.values())
+    
+    def notify_user(self, username: str, event: str, data: Any = None):
+        """向指定用户的所有连接推送消息（可在任意线程调用，不等待发送完成）"""
+        sockets = self._connections.get(username)
+        if sockets:
+            self._dispatch(list(sockets), {"type": event, "data": data})
+    
+    def broadcast(self, event: str, data: Any = None):
+        """向所有在线连接推送消息"""
+        sockets = [ws for group in self._connections.values() for ws in group]
+        if sockets:
+            self._dispatch(sockets, {"type": event, "data": data})
+    
+    def _dispatch(self, sockets: list, message: dict):
+        """在事件循环中发送消息"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        
+        coro = self._send_all(sockets, message)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        
+        if running is self._loop:
+            task = self._loop.create_task(coro)
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+    
+    @staticmethod
+    async def _send_all(sockets: list, message: dict):
+        """逐个发送，单个连接失败不影响其他连接"""
+        for ws in sockets:
+            try:
+                await ws.send_json(message)
+            except Exception:
+                pass
+
+
+# 全局单例
+hub = ConnectionHub()
+
+metrics.gauge("hicore_websocket_connections", "在线的用户长连接数").set_function(hub.connection_count)
@@ -0,0 +1,463 @@
+"""
+端到端压测工具
+在临时目录中生成合成 PDF/图片，启动 main:app，模拟多名标注员完整走一遍
+登录 -> 领取任务 -> 建立长连接心跳 -> 输入时调用自动补全 -> 提交（偶尔跳过）
+
+用法（在项目根目录执行）:
+    python bench/loadtest.py --users 20 --duration 60
+    python bench/loadtest.py --url http://127.0.0.1:8000 --admin admin:123   # 压测已运行的服务
+    python bench/loadtest.py --users 50 --json result.json
+
+输出每个接口的吞吐量与 p50/p95/p99 延迟，以及重复分配、租约丢失、请求被拒和服务端错误次数
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+from websockets.sync.client import connect as ws_connect
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 模拟输入用的候选值（同时也是提交内容，让自动补全缓存逐渐增长）
+CIRCUIT_NAMES = ["主回路", "照明回路", "空调回路", "插座回路", "动力回路", "备用回路", "消防回路"]
+AREAS = ["一楼", "二楼", "三楼", "车间A", "车间B", "仓库", "办公区"]
+VOLTAGES = ["220V", "380V", "400V"]
+
+# 心跳间隔（与 app.config.HEARTBEAT_INTERVAL 保持一致）
+PING_INTERVAL = 5
+
+# 租约丢失时提交/跳过被拒绝的原因（与 app.services.task_manager 的返回信息保持一致）
+LEASE_LOST_DETAILS = ("无效的任务令牌", "任务已失效，请重新领取")
+
+
+# ========== 合成数据 ==========
+
+def make_corpus(work_dir: Path, projects: int, machines: int, pages: int):
+    """
+    生成合成项目：每个机台一个多页 PDF，并预先生成 tmp/ 下的页面图片
+    图片已存在时扫描器直接复用，压测机器无需安装 poppler
+    """
+    for p in range(projects):
+        project_dir = work_dir / f"work_LT{p:03d}"
+        (project_dir / "pdf").mkdir(parents=True, exist_ok=True)
+        (project_dir / "tmp").mkdir(parents=True, exist_ok=True)
+        
+        for m in range(machines):
+            machine_id = f"M{m:04d}"
+            images = []
+            for page in range(pages):
+                image = Image.new("RGB", (620, 877), "white")
+                draw = ImageDraw.Draw(image)
+                draw.rectangle((40, 40, 580, 837), outline="black")
+                draw.text((60, 60), f"LT{p:03d} {machine_id} page {page}", fill="black")
+                images.append(image)
+                image.save(project_dir / "tmp" / f"{machine_id}_{page}.png")
+            images[0].save(
+                project_dir / "pdf" / f"{machine_id}.pdf", save_all=True, append_images=images[1:]
+            )
+
+
+# ========== 服务进程 ==========
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(base_dir: Path, port: int) -> subprocess.Popen:
+    """用临时 work/ 与 databases/ 启动 uvicorn，日志写入临时目录"""
+    env = dict(os.environ)
+    env["HICORE_WORK_DIR"] = str(base_dir / "work")
+    env["HICORE_DB_DIR"] = str(base_dir / "databases")
+    log = open(base_dir / "server.log", "wb")
+    
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，日志见 {base_dir / 'server.log'}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/v1/auth/status", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    
+    process.terminate()
+    raise RuntimeError("等待服务启动超时")
+
+
+# ========== 统计 ==========
+
+class Stats:
+    """线程安全的延迟与事件统计"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.events: Dict[str, int] = defaultdict(int)
+        self.holders: Dict[Tuple, str] = {}  # 任务 -> 当前持有者
+        self.completed: Dict[Tuple, int] = defaultdict(int)  # 任务 -> 提交次数
+    
+    def record(self, endpoint: str, elapsed: float, ok: bool):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+    
+    def count(self, event: str, amount: int = 1):
+        with self._lock:
+            self.events[event] += amount
+    
+    def acquire(self, key: Tuple, username: str):
+        """记录任务分配；同一任务同时分配给两个人即为重复分配"""
+        with self._lock:
+            holder = self.holders.get(key)
+            if holder is not None and holder != username:
+                self.events["duplicate_assignments"] += 1
+            self.holders[key] = username
+    
+    def release(self, key: Tuple, username: str, submitted: bool):
+        with self._lock:
+            if self.holders.get(key) == username:
+                del self.holders[key]
+            if submitted:
+                self.completed[key] += 1
+                if self.completed[key] > 1:
+                    self.events["duplicate_submissions"] += 1
+    
+    def report(self, elapsed: float) -> dict:
+        """汇总为 {endpoint: {count, errors, rps, p50_ms, p95_ms, p99_ms, max_ms}}"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, values in sorted(self.latencies.items()):
+                values = sorted(values)
+                endpoints[endpoint] = {
+                    "count": len(values),
+                    "errors": self.errors.get(endpoint, 0),
+                    "rps": round(len(values) / elapsed, 2),
+                    "p50_ms": _percentile(values, 50),
+                    "p95_ms": _percentile(values, 95),
+                    "p99_ms": _percentile(values, 99),
+                    "max_ms": round(values[-1] * 1000, 2),
+                }
+            events = dict(self.events)
+        for key in ("submitted", "skipped", "duplicate_assignments", "duplicate_submissions",
+                    "lost_leases", "rejected", "server_errors"):
+            events.setdefault(key, 0)
+        return {"duration_s": round(elapsed, 2), "endpoints": endpoints, "events": events}
+
+
+def _failure_event(status: int, body: dict) -> str:
+    """
+    提交/跳过失败的分类
+    lost_leases：任务令牌已回收或任务已重新分配；rejected：其他 4xx（校验失败、无权限等）；
+    server_errors：5xx 或连接失败
+    """
+    detail = body.get("detail") or body.get("msg")
+    if status == 400 and detail in LEASE_LOST_DETAILS:
+        return "lost_leases"
+    if 400 <= status < 500:
+        return "rejected"
+    return "server_errors"
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """最近秩百分位（values 已排序），返回毫秒"""
+    index = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return round(values[index] * 1000, 2)
+
+
+# ========== HTTP ==========
+
+class Client:
+    """简单的 JSON HTTP 客户端，每次调用都计入统计"""
+    
+    def __init__(self, base_url: str, stats: Stats, token: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.token = token
+    
+    def call(
+        self, endpoint: str, method: str, path: str, body=None, params=None, expected=()
+    ) -> Tuple[int, dict]:
+        """发送请求；2xx 及 expected 中的状态码不计为错误"""
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError:
+            status, payload = 0, b""
+        self.stats.record(endpoint, time.perf_counter() - start, 200 <= status < 300 or status in expected)
+        
+        try:
+            return status, json.loads(payload) if payload else {}
+        except ValueError:
+            return status, {}
+
+
+def login(base_url: str, stats: Stats, username: str, password: str) -> str:
+    client = Client(base_url, stats)
+    status, body = client.call("login", "POST", "/api/v1/auth/login",
+                               {"username": username, "password": password})
+    if status != 200:
+        raise RuntimeError(f"登录失败 {username}: {status} {body}")
+    return body["token"]
+
+
+def prepare_users(base_url: str, stats: Stats, admin: Tuple[str, str], count: int) -> List[Tuple[str, str]]:
+    """初始化系统（如未初始化）并创建压测账号"""
+    setup = Client(base_url, Stats())
+    setup.call("init", "POST", "/api/v1/auth/init", {"username": admin[0], "password": admin[1]})
+    setup.token = login(base_url, Stats(), *admin)
+    
+    users = []
+    for i in range(count):
+        username, password = f"lt_user_{i:03d}", "loadtest"
+        setup.call("create", "POST", "/api/v1/admin/users/create",
+                   {"username": username, "password": password})
+        users.append((username, password))
+    return users
+
+
+# ========== 模拟用户 ==========
+
+class SessionSocket(threading.Thread):
+    """用户长连接：定时 ping，丢弃服务端推送"""
+    
+    def __init__(self, ws_url: str, stats: Stats, stop: threading.Event):
+        super().__init__(daemon=True)
+        self.ws_url = ws_url
+        self.stats = stats
+        self.stop = stop
+        self.connected = threading.Event()
+    
+    def run(self):
+        start = time.perf_counter()
+        try:
+            ws = ws_connect(self.ws_url, open_timeout=10)
+        except Exception:
+            self.stats.record("ws_connect", time.perf_counter() - start, False)
+            self.connected.set()
+            return
+        self.stats.record("ws_connect", time.perf_counter() - start, True)
+        self.connected.set()
+        
+        with ws:
+            last_ping = 0.0
+            while not self.stop.is_set():
+                if time.monotonic() - last_ping >= PING_INTERVAL:
+                    try:
+                        ws.send("ping")
+                    except Exception:
+                        self.stats.count("ws_disconnects")
+                        return
+                    last_ping = time.monotonic()
+                try:
+                    message = ws.recv(timeout=0.5)
+                    if message != "pong":
+                        self.stats.count("ws_pushes")
+                except TimeoutError:
+                    pass
+                except Exception:
+                    self.stats.count("ws_disconnects")
+                    return
+
+
+def simulate_user(
+    base_url: str,
+    stats: Stats,
+    username: str,
+    password: str,
+    stop: threading.Event,
+    skip_rate: float,
+    think: float,
+    rng: random.Random
+):
+    """单个标注员的工作循环"""
+    try:
+        token = login(base_url, stats, username, password)
+    except RuntimeError as e:
+        print(f"[LoadTest] {e}")
+        return
+    client = Client(base_url, stats, token)
+    
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/session?" + urllib.parse.urlencode({"token": token})
+    session = SessionSocket(ws_url, stats, stop)
+    session.start()
+    session.connected.wait(10)
+    
+    while not stop.is_set():
+        status, body = client.call("fetch", "GET", "/api/v1/task/fetch", expected=(404,))
+        if status == 404:
+            stats.count("fetch_empty")
+            stop.wait(1)
+            continue
+        if status != 200:
+            stop.wait(1)
+            continue
+        
+        task = body["data"]
+        key = (task["project_id"], task["machine_id"], task["page_index"])
+        stats.acquire(key, username)
+        
+        # 看图
+        client.call("image", "GET", task["image"])
+        
+        if rng.random() < skip_rate:
+            stop.wait(think * rng.random())
+            status, body = client.call("skip", "POST", "/api/v1/task/skip", {"task_token": task["task_token"]})
+            stats.release(key, username, submitted=False)
+            stats.count("skipped" if status == 200 else _failure_event(status, body))
+            continue
+        
+        rows = []
+        for _ in range(rng.randint(1, 4)):
+            row = {
+                "machine_id": task["machine_id"],
+                "circuit_name": rng.choice(CIRCUIT_NAMES) + str(rng.randint(1, 50)),
+                "area": rng.choice(AREAS),
+                "voltage": rng.choice(VOLTAGES),
+            }
+            # 逐字输入时的补全请求
+            for field in ("circuit_name", "area"):
+                value = row[field]
+                for i in range(1, len(value) + 1):
+                    client.call("autocomplete", "GET", "/api/v1/autocomplete/suggest",
+                                params={"field": field, "q": value[:i], "limit": 10})
+                    if stop.wait(think / 10 * rng.random()):
+                        break
+            rows.append(row)
+        
+        status, body = client.call("submit", "POST", "/api/v1/task/submit",
+                                   {"task_token": task["task_token"], "rows": rows})
+        stats.release(key, username, submitted=status == 200)
+        stats.count("submitted" if status == 200 else _failure_event(status, body))
+    
+    session.join(timeout=5)
+
+
+# ========== 入口 ==========
+
+def print_report(report: dict):
+    print()
+    print(f"{'endpoint':<14}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint, s in report["endpoints"].items():
+        print(f"{endpoint:<14}{s['count']:>8}{s['errors']:>8}{s['rps']:>9}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    print()
+    for event, value in sorted(report["events"].items()):
+        print(f"{event:<24}{value:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HiCore 端到端压测")
+    parser.add_argument("--users", type=int, default=20, help="模拟用户数")
+    parser.add_argument("--duration", type=float, default=60, help="压测秒数")
+    parser.add_argument("--projects", type=int, default=2, help="合成项目数")
+    parser.add_argument("--machines", type=int, default=50, help="每个项目的机台（PDF）数")
+    parser.add_argument("--pages", type=int, default=3, help="每个 PDF 的页数")
+    parser.add_argument("--skip-rate", type=float, default=0.1, help="跳过任务的概率")
+    parser.add_argument("--think", type=float, default=0.5, help="每个任务的思考时间上限（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--url", help="压测已运行的服务（不生成数据、不启动进程）")
+    parser.add_argument("--admin", default="admin:123", help="管理员账号 用户名:密码")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    args = parser.parse_args()
+    
+    admin = tuple(args.admin.split(":", 1))
+    base_dir: Optional[Path] = None
+    server: Optional[subprocess.Popen] = None
+    
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            base_dir = Path(tempfile.mkdtemp(prefix="hicore-loadtest-"))
+            print(f"[LoadTest] 生成数据: {base_dir}")
+            make_corpus(base_dir / "work", args.projects, args.machines, args.pages)
+            port = _free_port()
+            server = start_server(base_dir, port)
+            base_url = f"http://127.0.0.1:{port}"
+        
+        stats = Stats()
+        users = prepare_users(base_url, stats, admin, args.users)
+        print(f"[LoadTest] {len(users)} 个用户, 持续 {args.duration}s, 目标 {base_url}")
+        
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=simulate_user,
+                args=(base_url, stats, username, password, stop, args.skip_rate, args.think,
+                      random.Random(args.seed * 1000 + i)),
+                daemon=True
+            )
+            for i, (username, password) in enumerate(users)
+        ]
+        
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=35)
+        
+        report = stats.report(time.perf_counter() - start)
+        report["config"] = vars(args)
+        print_report(report)
+        
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"\n[LoadTest] 结果已写入 {args.json}")
+    
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if base_dir is not None:
+            if args.keep:
+                print(f"[LoadTest] 临时目录已保留: {base_dir}")
+            else:
+                shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
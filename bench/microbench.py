@@ -0,0 +1,325 @@
+"""
+热点路径微基准
+覆盖 data.xlsx 生成、自动补全查询与加载、PDF 转图片，结果保存为 JSON 以便跨提交对比
+
+用法（在项目根目录执行）:
+    python bench/microbench.py                                    # 默认规模，结果写入 microbench-<提交>.json
+    python bench/microbench.py --only excel --excel-rows 1000,100000,500000
+    python bench/microbench.py --only suggest --suggest-sizes 10000,1000000
+    python bench/microbench.py --compare microbench-abc1234.json  # 与之前的结果对比
+
+所有数据都在临时目录中生成，不读写项目的 work/ 与 databases/
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 必须在导入 app 之前指向临时目录
+TMP_ROOT = Path(tempfile.mkdtemp(prefix="hicore-microbench-"))
+os.environ["HICORE_WORK_DIR"] = str(TMP_ROOT / "work")
+os.environ["HICORE_DB_DIR"] = str(TMP_ROOT / "databases")
+sys.path.insert(0, str(ROOT))
+
+from PIL import Image  # noqa: E402
+
+from app.config import WORK_DIR, DB_PATH  # noqa: E402
+from app.database import init_db, get_db, backfill_submission_rows  # noqa: E402
+from app.services import autocomplete, excel_writer, excel_cache, scanner, render_cache  # noqa: E402
+from app.services.exporter import write_xlsx  # noqa: E402
+
+BENCHMARKS = ("excel", "suggest", "history", "render")
+
+# 合成数据的取值
+CIRCUIT_WORDS = ["主回路", "照明", "空调", "插座", "动力", "备用", "消防", "水泵", "电梯", "风机"]
+AREAS = ["一楼", "二楼", "三楼", "车间A", "车间B", "仓库", "办公区", "屋顶", "地下室"]
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _random_row(rng: random.Random, machine_id: str) -> Dict[str, str]:
+    return {
+        "machine_id": machine_id,
+        "circuit_name": f"{rng.choice(CIRCUIT_WORDS)}{rng.randint(1, 9999)}",
+        "area": rng.choice(AREAS),
+        "device_pos": f"柜{rng.randint(1, 200)}",
+        "voltage": rng.choice(["220V", "380V"]),
+        "power": f"{rng.randint(1, 500)}kW",
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 0) -> Dict[str, float]:
+    """执行 fn 若干次，返回耗时统计（毫秒）"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "mean_ms": round(statistics.mean(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def _result(name: str, params: dict, timing: Dict[str, float]) -> dict:
+    result = {"name": name, "params": params, **timing}
+    label = ", ".join(f"{k}={v}" for k, v in params.items())
+    print(f"  {name:<38} {label:<40} median {timing['median_ms']:>10.2f} ms")
+    return result
+
+
+# ========== Excel 生成 ==========
+
+def _make_excel(project_id: str, rows: int, rows_per_submission: int = 2) -> int:
+    """生成已有 rows 行的 data.xlsx，返回最大 submission_id"""
+    rng = random.Random(rows)
+    project_dir = WORK_DIR / f"work_{project_id}"
+    if project_dir.exists():
+        shutil.rmtree(project_dir)
+    project_dir.mkdir(parents=True)
+    
+    def records():
+        for i in range(rows):
+            submission_id = i // rows_per_submission + 1
+            row = _random_row(rng, f"M{submission_id % 500:04d}")
+            record = {
+                "submission_id": submission_id,
+                "pdf_path": f"work_{project_id}/pdf/{row['machine_id']}.pdf#page0",
+                "request_ip": "127.0.0.1",
+                "request_time": "2025-01-01 00:00:00",
+                "username": "bench",
+                **row
+            }
+            yield [record.get(col, "") for col in excel_writer.COLUMNS]
+    
+    write_xlsx(records(), project_dir / "data.xlsx")
+    return (rows - 1) // rows_per_submission + 1
+
+
+def bench_excel(sizes: List[int], repeat: int) -> List[dict]:
+    """excel_cache.build_excel（从数据库整体生成 data.xlsx）在不同数据行数下的耗时"""
+    results = []
+    
+    for rows in sizes:
+        _fill_submissions(rows)
+        results.append(_result(
+            "excel_cache.build_excel", {"rows": rows},
+            measure(lambda: excel_cache.build_excel("bench"), repeat)
+        ))
+        shutil.rmtree(WORK_DIR / "work_bench", ignore_errors=True)
+    
+    return results
+
+
+# ========== 自动补全 ==========
+
+def bench_suggest(sizes: List[int], prefixes: List[int], repeat: int) -> List[dict]:
+    """get_suggestions 在不同缓存规模与前缀长度下的耗时"""
+    results = []
+    rng = random.Random(1)
+    
+    for size in sizes:
+        values = set()
+        while len(values) < size:
+            values.add(f"{rng.choice(CIRCUIT_WORDS)}{rng.randint(0, size * 10)}")
+        autocomplete._cache.clear()
+        autocomplete._cache["circuit_name"] = values
+        samples = list(values)
+        
+        for length in prefixes:
+            def query():
+                value = rng.choice(samples)
+                autocomplete.get_suggestions("circuit_name", value[:length], 10)
+            results.append(_result(
+                "autocomplete.get_suggestions", {"values": size, "prefix_len": length},
+                measure(query, repeat, warmup=1)
+            ))
+    
+    autocomplete._cache.clear()
+    return results
+
+
+def bench_history(project_counts: List[int], rows_per_project: int, repeat: int) -> List[dict]:
+    """load_history_from_excel（多个项目的 data.xlsx）与 load_history_from_db 的耗时"""
+    results = []
+    
+    for projects in project_counts:
+        for p in range(projects):
+            _make_excel(f"hist_{p:03d}", rows_per_project)
+        results.append(_result(
+            "autocomplete.load_history_from_excel",
+            {"projects": projects, "rows_per_project": rows_per_project},
+            measure(autocomplete.load_history_from_excel, repeat)
+        ))
+        for p in range(projects):
+            shutil.rmtree(WORK_DIR / f"work_hist_{p:03d}", ignore_errors=True)
+        
+        # 相同数据量的数据库加载
+        _fill_submissions(projects * rows_per_project)
+        results.append(_result(
+            "autocomplete.load_history_from_db",
+            {"projects": projects, "rows_per_project": rows_per_project},
+            measure(autocomplete.load_history_from_db, repeat)
+        ))
+    
+    return results
+
+
+def _fill_submissions(total_rows: int, rows_per_submission: int = 2):
+    """重建 submissions 表，共 total_rows 行数据"""
+    rng = random.Random(2)
+    if DB_PATH.exists():
+        DB_PATH.unlink()
+    init_db()
+    with get_db() as conn:
+        conn.executemany(
+            "INSERT INTO submissions (task_id, project_id, machine_id, page_index, username, data) "
+            "VALUES (?, 'bench', ?, 0, 'bench', ?)",
+            (
+                (i, f"M{i:05d}", json.dumps(
+                    [_random_row(rng, f"M{i:05d}") for _ in range(rows_per_submission)],
+                    ensure_ascii=False
+                ))
+                for i in range(total_rows // rows_per_submission)
+            )
+        )
+        conn.commit()
+    backfill_submission_rows(force=True)
+
+
+# ========== PDF 转图片 ==========
+
+def bench_render(pdf_counts: List[int], pages: int, repeat: int) -> List[dict]:
+    """convert_pdf_to_images 处理一批合成 PDF 的耗时（需要 poppler）"""
+    if render_cache.poppler_path() is None and shutil.which("pdftoppm") is None:
+        print("  跳过 scanner.convert_pdf_to_images：未安装 poppler")
+        return []
+    
+    results = []
+    corpus = TMP_ROOT / "corpus"
+    for count in pdf_counts:
+        shutil.rmtree(corpus, ignore_errors=True)
+        (corpus / "pdf").mkdir(parents=True)
+        for i in range(count):
+            images = [Image.new("RGB", (1240, 1754), "white") for _ in range(pages)]
+            images[0].save(corpus / "pdf" / f"M{i:04d}.pdf", save_all=True, append_images=images[1:])
+        
+        def render_all():
+            tmp_dir = corpus / "tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir()
+            for pdf in sorted((corpus / "pdf").glob("*.pdf")):
+                scanner.convert_pdf_to_images(pdf, tmp_dir, pdf.stem)
+        
+        timing = measure(render_all, repeat)
+        timing["pages_per_s"] = round(count * pages / (timing["median_ms"] / 1000), 2)
+        results.append(_result("scanner.convert_pdf_to_images", {"pdfs": count, "pages": pages}, timing))
+    
+    return results
+
+
+# ========== 结果 ==========
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result: dict) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(previous_path: Path, results: List[dict]):
+    """按基准名与参数对比两次运行的中位数"""
+    previous = json.loads(previous_path.read_text(encoding="utf-8"))
+    before = {_key(r): r for r in previous["results"]}
+    print(f"\n对比 {previous_path}（提交 {previous.get('commit')}）:")
+    for result in results:
+        old = before.get(_key(result))
+        if not old:
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        label = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"  {result['name']:<38} {label:<40} {old['median_ms']:>10.2f} -> "
+              f"{result['median_ms']:>10.2f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HiCore 热点路径微基准")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"要运行的基准，逗号分隔（{', '.join(BENCHMARKS)}）")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--excel-rows", default="1000,10000", help="生成 Excel 的数据行数，如 1000,100000,500000")
+    parser.add_argument("--suggest-sizes", default="10000,100000", help="自动补全缓存规模，如 10000,1000000")
+    parser.add_argument("--prefix-lengths", default="0,1,2,4", help="查询前缀长度")
+    parser.add_argument("--history-projects", default="5,20", help="加载历史时的项目数")
+    parser.add_argument("--history-rows", type=int, default=2000, help="每个项目的行数")
+    parser.add_argument("--render-pdfs", default="5", help="PDF 转图片的 PDF 数")
+    parser.add_argument("--render-pages", type=int, default=3, help="每个 PDF 的页数")
+    parser.add_argument("--output", help="结果 JSON 路径（默认 microbench-<提交>.json）")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+    
+    selected = {name.strip() for name in args.only.split(",")}
+    commit = _git_commit()
+    results: List[dict] = []
+    
+    try:
+        if "excel" in selected:
+            print("[Bench] excel_cache.build_excel")
+            results += bench_excel(_int_list(args.excel_rows), args.repeat)
+        if "suggest" in selected:
+            print("[Bench] autocomplete.get_suggestions")
+            results += bench_suggest(
+                _int_list(args.suggest_sizes), _int_list(args.prefix_lengths), max(args.repeat, 50)
+            )
+        if "history" in selected:
+            print("[Bench] autocomplete 历史加载")
+            results += bench_history(_int_list(args.history_projects), args.history_rows, args.repeat)
+        if "render" in selected:
+            print("[Bench] scanner.convert_pdf_to_images")
+            results += bench_render(_int_list(args.render_pdfs), args.render_pages, args.repeat)
+    finally:
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+    
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    output = Path(args.output or f"microbench-{commit or 'local'}.json")
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n[Bench] 结果已写入 {output}")
+    
+    if args.compare:
+        compare(Path(args.compare), results)
+
+
+if __name__ == "__main__":
+    main()
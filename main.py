@@ -1,18 +1,27 @@
 """
 机台数据人工采集系统 - 主入口
 """
+import asyncio
 import uvicorn
 from pathlib import Path
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from contextlib import asynccontextmanager
 
+from app.config import WORK_DIR
 from app.database import init_db
-from app.routers import auth, task, autocomplete, submission, admin
+from app.routers import auth, task, autocomplete, submission, admin, metrics
 from app.services.scanner import scan_and_init_tasks
-from app.services.autocomplete import load_history_from_excel
+from app.services.autocomplete import load_history_from_db
+from app.services.task_manager import task_manager
+from app.services.ready_queue import ready_queues
+from app.services.render_cache import render_cache, parse_page_name
+from app.services.watcher import pdf_watcher
+from app.services.metrics import MetricsMiddleware
+from app.responses import FastJSONResponse
+from app.frontend import FrontendAssets
 from app.websocket import heartbeat
 
 
@@ -22,15 +31,22 @@ async def lifespan(app: FastAPI):
     # 启动时初始化
     init_db()
     scan_and_init_tasks()
-    load_history_from_excel()
+    load_history_from_db()
+    lease_keeper = asyncio.create_task(task_manager.run_lease_keeper())
+    queue_refiller = asyncio.create_task(ready_queues.run_refiller())
+    watcher = asyncio.create_task(pdf_watcher.run())
     yield
-    # 关闭时清理（如需要）
+    # 关闭时清理
+    lease_keeper.cancel()
+    queue_refiller.cancel()
+    watcher.cancel()
 
 
 app = FastAPI(
     title="机台数据采集系统",
     version="2.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS 跨域配置
@@ -42,6 +58,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求耗时统计
+app.add_middleware(MetricsMiddleware)
+
 # 注册 API 路由（必须在前端 fallback 之前）
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["认证"])
 app.include_router(task.router, prefix="/api/v1/task", tags=["任务"])
@@ -49,25 +68,34 @@ app.include_router(submission.router, prefix="/api/v1/submission", tags=["提交
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["管理"])
 app.include_router(autocomplete.router, prefix="/api/v1/autocomplete", tags=["自动补全"])
 app.include_router(heartbeat.router, tags=["WebSocket"])
+app.include_router(metrics.router, tags=["监控"])
+
+# 页面图片（须在 /static 挂载之前注册）：记录访问，已被缓存淘汰的页面重新渲染
+@app.get("/static/work_{project_id}/tmp/{filename}", include_in_schema=False)
+def serve_page_image(project_id: str, filename: str):
+    parsed = parse_page_name(filename)
+    path = render_cache.get_page(project_id, *parsed) if parsed else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="图片不存在")
+    return FileResponse(path, media_type="image/png")
+
 
 # 静态文件服务
-app.mount("/static", StaticFiles(directory="work"), name="static")
+WORK_DIR.mkdir(parents=True, exist_ok=True)
+app.mount("/static", StaticFiles(directory=WORK_DIR), name="static")
 
-# 前端静态文件（生产模式）
+# 前端静态文件（生产模式，启动时索引并预压缩）
 WEB_DIST = Path(__file__).parent / "web" / "dist"
 if WEB_DIST.exists():
-    app.mount("/assets", StaticFiles(directory=WEB_DIST / "assets"), name="assets")
+    frontend = FrontendAssets(WEB_DIST)
     
-    @app.get("/")
-    async def serve_frontend():
-        return FileResponse(WEB_DIST / "index.html")
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def serve_frontend(request: Request):
+        return frontend.response(request, "index.html")
     
-    @app.get("/{path:path}")
-    async def serve_frontend_fallback(path: str):
-        file_path = WEB_DIST / path
-        if file_path.exists() and file_path.is_file():
-            return FileResponse(file_path)
-        return FileResponse(WEB_DIST / "index.html")
+    @app.api_route("/{path:path}", methods=["GET", "HEAD"])
+    async def serve_frontend_fallback(request: Request, path: str):
+        return frontend.response(request, path)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { api } from '../services/api';
-import { STATIC_BASE_URL } from '../constants';
+import { STATIC_BASE_URL, SCAN_POLL_INTERVAL_MS } from '../constants';
 import { 
   BarChart3, Users, FolderOpen, Clock, CheckCircle, 
   Lock, Unlock, RefreshCw, ChevronLeft, Search, Eye
@@ -47,6 +47,29 @@ interface Submission {
   data: any[];
 }
 
+interface SearchHit {
+  submission_id: number;
+  row_index: number;
+  project_id: string;
+  machine_id: string;
+  page_index: number;
+  username: string;
+  submitted_at: string;
+  image: string;
+  row: any;
+}
+
+interface ScanJob {
+  job_id: string;
+  status: 'running' | 'completed' | 'failed' | 'cancelled';
+  done: number;
+  total: number;
+  projects: { project_id: string; done: number; total: number }[];
+  cancel_requested: boolean;
+  result: { scanned: number; new_tasks: number } | null;
+  error: string | null;
+}
+
 interface AdminConsoleProps {
   onBack: () => void;
 }
@@ -66,6 +89,8 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
   // 筛选
   const [filterUsername, setFilterUsername] = useState('');
   const [filterProject, setFilterProject] = useState('');
+  const [filterKeyword, setFilterKeyword] = useState('');
+  const [showingHits, setShowingHits] = useState(false);
   
   // 详情弹窗
   const [selectedSubmission, setSelectedSubmission] = useState<Submission | null>(null);
@@ -73,6 +98,7 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
   const [newUsername, setNewUsername] = useState('');
   const [newPassword, setNewPassword] = useState('');
   const [scanning, setScanning] = useState(false);
+  const [scanJob, setScanJob] = useState<ScanJob | null>(null);
 
   useEffect(() => {
     loadStats();
@@ -95,18 +121,41 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
     }
   };
 
+  // 扫描在后台执行，轮询任务状态直到结束
   const handleScan = async () => {
     setScanning(true);
     setError(null);
     try {
-      const res = await api.adminRequest('/admin/scan', 'POST');
-      alert(res.msg || `扫描完成: ${res.data?.new_tasks || 0} 个新任务`);
+      let job: ScanJob = await api.adminRequest('/admin/scan', 'POST');
+      setScanJob(job);
+      while (job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, SCAN_POLL_INTERVAL_MS));
+        job = await api.adminRequest(`/admin/scan/jobs/${job.job_id}`);
+        setScanJob(job);
+      }
+      if (job.status === 'completed') {
+        alert(`扫描完成: ${job.result?.scanned || 0} 个PDF, ${job.result?.new_tasks || 0} 个新任务`);
+      } else if (job.status === 'cancelled') {
+        alert('扫描已取消');
+      } else {
+        setError(`扫描失败: ${job.error || '未知错误'}`);
+      }
       loadStats();
       if (tab === 'projects') loadProjects();
     } catch (e: any) {
       setError(e.message);
     } finally {
       setScanning(false);
+      setScanJob(null);
+    }
+  };
+
+  const handleCancelScan = async () => {
+    if (!scanJob) return;
+    try {
+      await api.adminRequest(`/admin/scan/jobs/${scanJob.job_id}/cancel`, 'POST');
+    } catch (e: any) {
+      setError(e.message);
     }
   };
 
@@ -153,11 +202,31 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
   const loadSubmissions = async () => {
     setLoading(true);
     try {
+      if (filterKeyword.trim()) {
+        // 关键词走服务端全文检索，每个命中行显示为一条只含该行的记录
+        let url = `/admin/search?limit=100&q=${encodeURIComponent(filterKeyword.trim())}`;
+        if (filterProject) url += `&project_id=${encodeURIComponent(filterProject)}`;
+        const res = await api.adminRequest(url);
+        setSubmissions((Array.isArray(res) ? res : []).map((hit: SearchHit) => ({
+          id: hit.submission_id,
+          project_id: hit.project_id,
+          machine_id: hit.machine_id,
+          page_index: hit.page_index,
+          username: hit.username,
+          submitted_at: hit.submitted_at,
+          image: hit.image,
+          row_count: 1,
+          data: [hit.row],
+        })));
+        setShowingHits(true);
+        return;
+      }
       let url = '/admin/submissions?limit=100';
       if (filterUsername) url += `&username=${filterUsername}`;
       if (filterProject) url += `&project_id=${filterProject}`;
       const res = await api.adminRequest(url);
       setSubmissions(Array.isArray(res) ? res : []);
+      setShowingHits(false);
     } catch (e: any) {
       setError(e.message);
       setSubmissions([]);
@@ -261,16 +330,35 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
           <div className="space-y-6">
             <div className="flex items-center justify-between">
               <h2 className="text-2xl font-bold">系统概览</h2>
-              <Button 
-                onClick={handleScan} 
-                disabled={scanning}
-                className="bg-green-600 hover:bg-green-700"
-              >
-                <RefreshCw size={16} className={`mr-2 ${scanning ? 'animate-spin' : ''}`} />
-                {scanning ? '扫描中...' : '扫描新任务'}
-              </Button>
+              <div className="flex gap-2">
+                {scanJob && scanJob.status === 'running' && (
+                  <Button variant="outline" onClick={handleCancelScan} disabled={scanJob.cancel_requested}>
+                    {scanJob.cancel_requested ? '正在取消...' : '取消扫描'}
+                  </Button>
+                )}
+                <Button 
+                  onClick={handleScan} 
+                  disabled={scanning}
+                  className="bg-green-600 hover:bg-green-700"
+                >
+                  <RefreshCw size={16} className={`mr-2 ${scanning ? 'animate-spin' : ''}`} />
+                  {scanning
+                    ? (scanJob && scanJob.total ? `扫描中 ${scanJob.done}/${scanJob.total}` : '扫描中...')
+                    : '扫描新任务'}
+                </Button>
+              </div>
             </div>
             
+            {scanJob && scanJob.projects.length > 0 && (
+              <div className="bg-white rounded-xl shadow-sm p-4 text-sm text-gray-600 flex flex-wrap gap-x-6 gap-y-1">
+                {scanJob.projects.map(p => (
+                  <span key={p.project_id}>
+                    {p.project_id}: {p.done}/{p.total}
+                  </span>
+                ))}
+              </div>
+            )}
+            
             {!stats ? (
               <div className="text-center text-gray-500 py-8">加载中...</div>
             ) : (
@@ -518,6 +606,16 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
                   className="px-3 py-2 border rounded-lg text-sm"
                 />
               </div>
+              <div className="flex items-center gap-2">
+                <input
+                  type="text"
+                  placeholder="关键词（回路/区域/位置/备注）"
+                  value={filterKeyword}
+                  onChange={e => setFilterKeyword(e.target.value)}
+                  onKeyDown={e => e.key === 'Enter' && loadSubmissions()}
+                  className="px-3 py-2 border rounded-lg text-sm w-64"
+                />
+              </div>
               <Button onClick={loadSubmissions}>搜索</Button>
             </div>
             
@@ -534,15 +632,17 @@ export const AdminConsole: React.FC<AdminConsoleProps> = ({ onBack }) => {
                   </tr>
                 </thead>
                 <tbody className="divide-y">
-                  {submissions.map((s: Submission) => (
-                    <tr key={s.id} className="hover:bg-gray-50">
+                  {submissions.map((s: Submission, i: number) => (
+                    <tr key={`${s.id}-${i}`} className="hover:bg-gray-50">
                       <td className="px-4 py-3 text-gray-400">#{s.id}</td>
                       <td className="px-4 py-3">
                         <span className="font-medium">{s.machine_id}</span>
                         <span className="text-gray-400 text-sm ml-1">p{s.page_index + 1}</span>
                       </td>
                       <td className="px-4 py-3 text-blue-600">{s.username}</td>
-                      <td className="px-4 py-3">{s.row_count} 行</td>
+                      <td className="px-4 py-3">
+                        {showingHits ? s.data[0]?.circuit_name : `${s.row_count} 行`}
+                      </td>
                       <td className="px-4 py-3 text-gray-500 text-sm">{s.submitted_at}</td>
                       <td className="px-4 py-3">
                         <button
@@ -8,6 +8,8 @@ interface AutocompleteInputProps {
   placeholder?: string;
   className?: string;
   required?: boolean;
+  projectId?: string;
+  machineId?: string;
 }
 
 export const AutocompleteInput: React.FC<AutocompleteInputProps> = ({
@@ -16,7 +18,9 @@ export const AutocompleteInput: React.FC<AutocompleteInputProps> = ({
   onChange,
   placeholder,
   className = '',
-  required = false
+  required = false,
+  projectId,
+  machineId
 }) => {
   const [suggestions, setSuggestions] = useState<string[]>([]);
   const [isOpen, setIsOpen] = useState(false);
@@ -51,7 +55,10 @@ export const AutocompleteInput: React.FC<AutocompleteInputProps> = ({
     setLoading(true);
     timeoutRef.current = window.setTimeout(async () => {
       try {
-        const results = await api.getSuggestions(field, newVal);
+        const results = await api.getSuggestions(field, newVal, {
+          project_id: projectId,
+          machine_id: machineId,
+        });
         setSuggestions(results || []);
         setIsOpen((results || []).length > 0);
       } finally {
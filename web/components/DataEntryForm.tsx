@@ -106,6 +106,8 @@ export const DataEntryForm: React.FC<DataEntryFormProps> = ({ task, rows, setRow
             <div className="flex-[1.8] min-w-[120px]">
               <AutocompleteInput
                 field="circuit_name"
+                projectId={task.project_id}
+                machineId={row.machine_id || task.machine_id}
                 value={row.circuit_name}
                 onChange={(val) => updateRow(index, 'circuit_name', val)}
                 className="w-full h-9 px-2 text-sm border border-gray-300 rounded focus:border-blue-500 focus:ring-1 focus:ring-blue-500 bg-white"
@@ -133,6 +135,8 @@ export const DataEntryForm: React.FC<DataEntryFormProps> = ({ task, rows, setRow
                     ) : (
                       <AutocompleteInput
                           field={col.field}
+                          projectId={task.project_id}
+                          machineId={row.machine_id || task.machine_id}
                           value={(row as any)[col.field]}
                           onChange={(val) => updateRow(index, col.field as keyof TaskRow, val)}
                           className="w-full h-9 px-2 text-sm text-center border border-gray-300 rounded focus:border-blue-500 focus:ring-1 focus:ring-blue-500 bg-gray-50 focus:bg-white transition-colors"
@@ -146,6 +150,8 @@ export const DataEntryForm: React.FC<DataEntryFormProps> = ({ task, rows, setRow
             <div className="flex-1 min-w-[70px]">
                 <AutocompleteInput
                     field="machine_switch"
+                    projectId={task.project_id}
+                    machineId={row.machine_id || task.machine_id}
                     value={row.machine_switch}
                     onChange={(val) => updateRow(index, 'machine_switch', val)}
                     className="w-full h-9 px-2 text-sm text-center border border-blue-200 rounded focus:border-blue-500 focus:ring-1 focus:ring-blue-500 bg-blue-50/50 focus:bg-white text-blue-700 transition-colors"
@@ -155,6 +161,8 @@ export const DataEntryForm: React.FC<DataEntryFormProps> = ({ task, rows, setRow
             <div className="flex-1 min-w-[70px]">
                  <AutocompleteInput
                     field="factory_switch"
+                    projectId={task.project_id}
+                    machineId={row.machine_id || task.machine_id}
                     value={row.factory_switch}
                     onChange={(val) => updateRow(index, 'factory_switch', val)}
                     className="w-full h-9 px-2 text-sm text-center border border-purple-200 rounded focus:border-purple-500 focus:ring-1 focus:ring-purple-500 bg-purple-50/50 focus:bg-white text-purple-700 transition-colors"
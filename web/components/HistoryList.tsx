@@ -14,6 +14,9 @@ export const HistoryList: React.FC<HistoryListProps> = ({ onEdit, onBack }) => {
   const [submissions, setSubmissions] = useState<SubmissionItem[]>([]);
   const [loading, setLoading] = useState(true);
   const [filterProject, setFilterProject] = useState<string>('');
+  // 下一页游标，为空表示已加载全部
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadSubmissions();
@@ -21,8 +24,9 @@ export const HistoryList: React.FC<HistoryListProps> = ({ onEdit, onBack }) => {
 
   const loadSubmissions = async () => {
     try {
-      const data = await api.getSubmissions();
-      setSubmissions(data);
+      const page = await api.getSubmissions();
+      setSubmissions(page.items);
+      setNextCursor(page.nextCursor);
     } catch (e) {
       console.error('Failed to load submissions', e);
     } finally {
@@ -30,6 +34,20 @@ export const HistoryList: React.FC<HistoryListProps> = ({ onEdit, onBack }) => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const page = await api.getSubmissions(nextCursor);
+      setSubmissions(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (e) {
+      console.error('Failed to load more submissions', e);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // 获取所有项目列表
   const projects = [...new Set(submissions.map(s => s.project_id))].sort().reverse();
   
@@ -53,7 +71,7 @@ export const HistoryList: React.FC<HistoryListProps> = ({ onEdit, onBack }) => {
           <ChevronLeft size={20} />
         </button>
         <h2 className="text-lg font-bold">我的提交记录</h2>
-        <span className="text-sm text-gray-500">共 {filteredSubmissions.length} 条</span>
+        <span className="text-sm text-gray-500">共 {filteredSubmissions.length}{nextCursor ? '+' : ''} 条</span>
         
         {/* 项目筛选 */}
         {projects.length > 1 && (
@@ -128,6 +146,15 @@ export const HistoryList: React.FC<HistoryListProps> = ({ onEdit, onBack }) => {
           ))}
         </div>
       )}
+
+      {/* 加载更多 */}
+      {nextCursor && (
+        <div className="px-4 pb-6 flex justify-center">
+          <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? '加载中...' : '加载更多'}
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,7 +1,7 @@
 import React, { useEffect, useState, useRef, useCallback } from 'react';
 import { api } from '../services/api';
 import { TaskData, TaskStatus, TaskRow, ConnectionStatus, SubmissionItem } from '../types';
-import { getWsBaseUrl, PING_INTERVAL_MS } from '../constants';
+import { getSessionWsUrl, PING_INTERVAL_MS, RECONNECT_DELAY_MS } from '../constants';
 import { ImageViewer } from './ImageViewer';
 import { DataEntryForm } from './DataEntryForm';
 import { Button } from './Button';
@@ -14,6 +14,12 @@ interface WorkspaceProps {
 
 type ViewMode = 'task' | 'history' | 'edit';
 
+// crypto.randomUUID 只在安全上下文（HTTPS / localhost）中可用
+const newRequestKey = (): string =>
+  typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function'
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+
 export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
   const [viewMode, setViewMode] = useState<ViewMode>('task');
   const [status, setStatus] = useState<TaskStatus>(TaskStatus.IDLE);
@@ -34,12 +40,19 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
 
   const wsRef = useRef<WebSocket | null>(null);
   const pingIntervalRef = useRef<number | null>(null);
+  const reconnectTimerRef = useRef<number | null>(null);
   const statusRef = useRef<TaskStatus>(TaskStatus.IDLE);
+  const taskTokenRef = useRef<string | null>(null);
+  const submitKeyRef = useRef<{ taskToken: string; key: string } | null>(null);
 
   useEffect(() => {
     statusRef.current = status;
   }, [status]);
 
+  useEffect(() => {
+    taskTokenRef.current = task?.task_token ?? null;
+  }, [task]);
+
   // 加载可用项目列表
   useEffect(() => {
     loadProjects();
@@ -65,8 +78,13 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
   };
 
   // --- WebSocket Logic ---
+  // 一个会话只建立一条长连接，心跳覆盖当前持有的任务，同时接收服务端推送
 
   const cleanupWS = useCallback(() => {
+    if (reconnectTimerRef.current) {
+      clearTimeout(reconnectTimerRef.current);
+      reconnectTimerRef.current = null;
+    }
     if (pingIntervalRef.current) {
       clearInterval(pingIntervalRef.current);
       pingIntervalRef.current = null;
@@ -79,13 +97,50 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
     setWsStatus(ConnectionStatus.DISCONNECTED);
   }, []);
 
-  const startHeartbeat = useCallback((token: string) => {
-    cleanupWS(); 
+  const handleServerPush = useCallback((message: { type: string; data?: any }) => {
+    switch (message.type) {
+      case 'leaderboard':
+        setLeaderboard(message.data || []);
+        break;
+      case 'projects':
+        setProjects(message.data || []);
+        break;
+      case 'project_availability': {
+        const { project_id, available_count } = message.data;
+        setProjects(prev => {
+          const others = prev.filter(p => p.project_id !== project_id);
+          const next = available_count > 0 ? [...others, { project_id, available_count }] : others;
+          return next.sort((a, b) => b.project_id.localeCompare(a.project_id));
+        });
+        break;
+      }
+      case 'lease_expiring':
+        if (wsRef.current?.readyState === WebSocket.OPEN) {
+          wsRef.current.send('ping');
+        }
+        break;
+      case 'task_removed':
+        // 当前页面所在的 PDF 已被删除或替换，任务已失效
+        if (message.data?.task_token === taskTokenRef.current) {
+          setTask(null);
+          setRows([]);
+          setErrorMsg('当前页面所在的 PDF 已被删除或替换，请重新领取任务');
+          setStatus(TaskStatus.IDLE);
+        }
+        break;
+    }
+  }, []);
+
+  const connectSession = useCallback(() => {
+    const token = api.getToken();
+    if (!token) return;
+
+    cleanupWS();
     setWsStatus(ConnectionStatus.CONNECTING);
-    
-    const ws = new WebSocket(`${getWsBaseUrl()}/${token}`);
+
+    const ws = new WebSocket(getSessionWsUrl(token));
     wsRef.current = ws;
-    
+
     ws.onopen = () => {
       setWsStatus(ConnectionStatus.CONNECTED);
       pingIntervalRef.current = window.setInterval(() => {
@@ -95,29 +150,45 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
       }, PING_INTERVAL_MS);
     };
 
+    ws.onmessage = (event) => {
+      if (event.data === 'pong') return;
+      try {
+        handleServerPush(JSON.parse(event.data));
+      } catch (e) {
+        console.warn('Invalid WS message', e);
+      }
+    };
+
     ws.onclose = (event) => {
-        setWsStatus(ConnectionStatus.DISCONNECTED);
-        if (statusRef.current === TaskStatus.WORKING && event.code !== 1000) {
-           setErrorMsg("连接中断，请刷新任务 (Code: " + event.code + ")");
-        }
+      if (pingIntervalRef.current) {
+        clearInterval(pingIntervalRef.current);
+        pingIntervalRef.current = null;
+      }
+      setWsStatus(ConnectionStatus.DISCONNECTED);
+      if (event.code === 4001) {
+        setErrorMsg("登录已失效，请重新登录");
+        return;
+      }
+      // 在服务端释放窗口内自动重连，任务保持锁定
+      reconnectTimerRef.current = window.setTimeout(connectSession, RECONNECT_DELAY_MS);
     };
 
     ws.onerror = () => {
         console.warn('WS Error occurred');
     };
 
-  }, [cleanupWS]);
+  }, [cleanupWS, handleServerPush]);
 
   useEffect(() => {
+    connectSession();
     return () => cleanupWS();
-  }, [cleanupWS]);
+  }, [connectSession, cleanupWS]);
 
 
   // --- Task Actions ---
 
   const fetchTask = async (projectId?: string) => {
     try {
-      cleanupWS();
       setStatus(TaskStatus.FETCHING);
       setErrorMsg(null);
       setRows([]);
@@ -128,7 +199,6 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
       if (response && response.data) {
         setTask(response.data);
         setStatus(TaskStatus.WORKING);
-        startHeartbeat(response.data.task_token);
       } else {
         throw new Error('Invalid response from server');
       }
@@ -151,7 +221,6 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
       setIsSkipping(true); // 开始跳过，清除图片显示加载
       setRows([]);
       await api.skipTask(task.task_token);
-      cleanupWS();
       loadProjects();
       
       // 直接获取新任务
@@ -160,7 +229,6 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
       if (response && response.data) {
         setTask(response.data);
         setStatus(TaskStatus.WORKING);
-        startHeartbeat(response.data.task_token);
       } else {
         setTask(null);
         setStatus(TaskStatus.NO_TASK);
@@ -190,13 +258,18 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
     try {
       setStatus(TaskStatus.SUBMITTING); 
       
+      // 每个任务一个幂等键，用户再次点击提交时沿用
+      if (submitKeyRef.current?.taskToken !== task.task_token) {
+        submitKeyRef.current = { taskToken: task.task_token, key: newRequestKey() };
+      }
+      
       await api.submitTask({
         task_token: task.task_token,
-        rows: rows
+        rows: rows,
+        request_key: submitKeyRef.current.key
       });
       
       updateContribution();
-      cleanupWS();
       fetchTask(); 
       
     } catch (err: any) {
@@ -390,6 +463,12 @@ export const Workspace: React.FC<WorkspaceProps> = ({ updateContribution }) => {
                   </>
                 )}
 
+                {errorMsg && (
+                  <div className="mb-4 px-4 py-2 bg-red-50 text-red-600 rounded-lg flex items-center gap-2 text-sm">
+                    <AlertTriangle size={16} /> {errorMsg}
+                  </div>
+                )}
+
                 <Button 
                   onClick={() => { loadProjects(); loadLeaderboard(); fetchTask(); }} 
                   className="w-full py-3.5 text-base shadow-lg hover:shadow-xl transition-all bg-gradient-to-r from-blue-600 to-indigo-600 hover:from-blue-700 hover:to-indigo-700"
@@ -10,5 +10,14 @@ export const getWsBaseUrl = () => {
   return `${protocol}//${window.location.host}/ws/heartbeat`;
 };
 
+// Session WebSocket URL - opened once after login, carries task heartbeats and server pushes
+export const getSessionWsUrl = (token: string) => {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+  return `${protocol}//${window.location.host}/ws/session?token=${encodeURIComponent(token)}`;
+};
+
+export const RECONNECT_DELAY_MS = 2000; // Session reconnect delay, well within the release window
+export const SUBMIT_RETRY_DELAYS_MS = [1000, 2000, 4000, 8000]; // Submit retries on network errors (safe: request_key makes them idempotent)
+export const SCAN_POLL_INTERVAL_MS = 1000; // Admin scan job status polling
 export const PING_INTERVAL_MS = 3000; // Send ping every 3 seconds
 export const RECONNECT_WINDOW_MS = 10000; // 10 seconds to reconnect
@@ -1,5 +1,5 @@
-import { API_BASE_URL } from '../constants';
-import { ApiResponse, LoginResponse, SubmitPayload, TaskData, SubmissionItem } from '../types';
+import { API_BASE_URL, SUBMIT_RETRY_DELAYS_MS } from '../constants';
+import { ApiResponse, LoginResponse, SubmitPayload, TaskData, SubmissionItem, SubmissionPage } from '../types';
 
 class ApiService {
   private token: string | null = null;
@@ -20,7 +20,8 @@ class ApiService {
     return this.token;
   }
 
-  private async request<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
+  // unwrap 为 false 时返回完整响应体（分页接口需要 next_cursor 等字段）
+  private async request<T>(endpoint: string, options: RequestInit = {}, unwrap = true): Promise<T> {
     const token = this.getToken();
     
     const headers: HeadersInit = {
@@ -48,7 +49,7 @@ class ApiService {
         throw new Error(data.msg || 'Unknown API Error');
       }
 
-      return data.data || data;
+      return unwrap ? (data.data || data) : data;
     } catch (error: any) {
       console.error(`API Request failed: ${endpoint}`, error);
       throw error;
@@ -141,10 +142,21 @@ class ApiService {
   }
 
   async submitTask(payload: SubmitPayload): Promise<ApiResponse> {
-    return this.request<ApiResponse>('/task/submit', {
-      method: 'POST',
-      body: JSON.stringify(payload),
-    });
+    // 网络错误（fetch 抛出 TypeError）时用同一个 request_key 重试，
+    // 已经提交成功的请求由服务端按记录直接返回成功，不会重复保存
+    for (let attempt = 0; ; attempt++) {
+      try {
+        return await this.request<ApiResponse>('/task/submit', {
+          method: 'POST',
+          body: JSON.stringify(payload),
+        });
+      } catch (error) {
+        if (!(error instanceof TypeError) || !payload.request_key || attempt >= SUBMIT_RETRY_DELAYS_MS.length) {
+          throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, SUBMIT_RETRY_DELAYS_MS[attempt]));
+      }
+    }
   }
 
   async skipTask(taskToken: string): Promise<void> {
@@ -154,9 +166,17 @@ class ApiService {
     });
   }
 
-  async getSuggestions(field: string, query: string): Promise<string[]> {
+  // context: 当前任务的项目和机台，服务端优先返回该范围内的历史值
+  async getSuggestions(
+    field: string,
+    query: string,
+    context?: { project_id?: string; machine_id?: string }
+  ): Promise<string[]> {
     if (!query) return [];
-    const queryString = new URLSearchParams({ field, q: query, limit: '10' }).toString();
+    const params = new URLSearchParams({ field, q: query, limit: '10' });
+    if (context?.project_id) params.set('project_id', context.project_id);
+    if (context?.machine_id) params.set('machine_id', context.machine_id);
+    const queryString = params.toString();
     try {
       return await this.request<string[]>(`/autocomplete/suggest?${queryString}`, {
         method: 'GET',
@@ -167,8 +187,12 @@ class ApiService {
     }
   }
 
-  async getSubmissions(): Promise<SubmissionItem[]> {
-    return this.request<SubmissionItem[]>('/submission/list', { method: 'GET' });
+  async getSubmissions(cursor?: string | null): Promise<SubmissionPage> {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const res = await this.request<{ data: SubmissionItem[]; next_cursor: string | null }>(
+      `/submission/list${query}`, { method: 'GET' }, false
+    );
+    return { items: res.data || [], nextCursor: res.next_cursor || null };
   }
 
   async getSubmission(id: number): Promise<SubmissionItem> {
@@ -37,6 +37,7 @@ export interface TaskRow {
 export interface SubmitPayload {
   task_token: string;
   rows: TaskRow[];
+  request_key?: string; // Idempotency key, unchanged across retries of the same submit
 }
 
 export enum TaskStatus {
@@ -65,3 +66,8 @@ export interface SubmissionItem {
   image: string;
   data: TaskRow[];
 }
+
+export interface SubmissionPage {
+  items: SubmissionItem[];
+  nextCursor: string | null;
+}